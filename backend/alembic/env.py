@@ -11,7 +11,8 @@ from models.base import Base
 # Import all models so Base.metadata has them
 from models.user import User
 from models.rule import Rule
-from models.prompt import PromptRequest, PromptEvaluation
+from models.prompt import PromptBlob, PromptRequest, PromptEvaluation
+from models.stats import UserStats, UserDailyStats
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,29 @@
+"""History keyset index
+
+Revision ID: 5e8d3a1c7f20
+Revises: 9c1f2e7a5b3d
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8d3a1c7f20'
+down_revision: Union[str, None] = '9c1f2e7a5b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_promptrequest_user_created_id', 'promptrequest', ['user_id', 'created_at', 'id'], unique=False)
+    # Covered by the leading column of the composite index
+    op.drop_index('ix_promptrequest_user_id', table_name='promptrequest')
+
+
+def downgrade() -> None:
+    op.create_index('ix_promptrequest_user_id', 'promptrequest', ['user_id'], unique=False)
+    op.drop_index('ix_promptrequest_user_created_id', table_name='promptrequest')
@@ -0,0 +1,68 @@
+"""User stats counter tables
+
+Revision ID: 9c1f2e7a5b3d
+Revises: 4b20dd215db0
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1f2e7a5b3d'
+down_revision: Union[str, None] = '4b20dd215db0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('userstats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('accepted_count', sa.Integer(), nullable=False),
+    sa.Column('declined_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('userdailystats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('accepted_count', sa.Integer(), nullable=False),
+    sa.Column('declined_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'day', name='uq_userdailystats_user_day')
+    )
+    op.create_index(op.f('ix_userdailystats_id'), 'userdailystats', ['id'], unique=False)
+    op.create_index(op.f('ix_userdailystats_day'), 'userdailystats', ['day'], unique=False)
+    # Backfill from existing history; later drift can be fixed with `python -m cli rebuild-user-stats`
+    if op.get_bind().dialect.name == 'postgresql':
+        day = "CAST(created_at AT TIME ZONE 'UTC' AS DATE)"
+    else:
+        day = "DATE(created_at)"
+    op.execute("""
+        INSERT INTO userstats (user_id, total, accepted_count, declined_count)
+        SELECT user_id, COUNT(id),
+               SUM(CASE WHEN decision = 'ACCEPT' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN decision = 'DECLINE' THEN 1 ELSE 0 END)
+        FROM promptrequest GROUP BY user_id
+    """)
+    op.execute(f"""
+        INSERT INTO userdailystats (user_id, day, total, accepted_count, declined_count)
+        SELECT user_id, {day}, COUNT(id),
+               SUM(CASE WHEN decision = 'ACCEPT' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN decision = 'DECLINE' THEN 1 ELSE 0 END)
+        FROM promptrequest GROUP BY user_id, {day}
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_userdailystats_day'), table_name='userdailystats')
+    op.drop_index(op.f('ix_userdailystats_id'), table_name='userdailystats')
+    op.drop_table('userdailystats')
+    op.drop_table('userstats')
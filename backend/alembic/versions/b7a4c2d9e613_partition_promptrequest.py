@@ -0,0 +1,122 @@
+"""Partition promptrequest by month
+
+Revision ID: b7a4c2d9e613
+Revises: 5e8d3a1c7f20
+Create Date: 2026-10-16 14:00:00.000000
+
+PostgreSQL only; a no-op on other databases.
+
+Range partitions require the partition key in every unique constraint, so the
+primary key becomes (id, created_at) and promptevaluation.request_id can no
+longer reference promptrequest.id. The id sequence is kept, so ids stay unique.
+Monthly partitions are created from the oldest row up to three months ahead,
+plus a default partition; `python -m cli ensure-partitions` keeps creating
+future ones.
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7a4c2d9e613'
+down_revision: Union[str, None] = '5e8d3a1c7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, user_id, prompt_text, intended_use, context, decision, reason_summary, created_at"
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.drop_constraint('promptevaluation_request_id_fkey', 'promptevaluation', type_='foreignkey')
+    op.execute("ALTER SEQUENCE promptrequest_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE promptrequest RENAME TO promptrequest_unpartitioned")
+    op.drop_index('ix_promptrequest_id', table_name='promptrequest_unpartitioned')
+    op.drop_index('ix_promptrequest_user_created_id', table_name='promptrequest_unpartitioned')
+    op.execute("ALTER TABLE promptrequest_unpartitioned RENAME CONSTRAINT promptrequest_pkey TO promptrequest_unpartitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE promptrequest (
+            id INTEGER NOT NULL DEFAULT nextval('promptrequest_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES "user" (id),
+            prompt_text TEXT NOT NULL,
+            intended_use VARCHAR NOT NULL,
+            context TEXT,
+            decision VARCHAR,
+            reason_summary VARCHAR,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT promptrequest_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE promptrequest_id_seq OWNED BY promptrequest.id")
+
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM promptrequest_unpartitioned")).scalar()
+    today = datetime.now(timezone.utc).date()
+    month = (oldest.astimezone(timezone.utc).date() if oldest else today).replace(day=1)
+    last = _add_months(today.replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE promptrequest_p{month:%Y_%m} PARTITION OF promptrequest "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        month = following
+    # Catches rows outside the monthly ranges if ensure-partitions stops running
+    op.execute("CREATE TABLE promptrequest_default PARTITION OF promptrequest DEFAULT")
+
+    op.execute(f"""
+        INSERT INTO promptrequest ({COLUMNS})
+        SELECT id, user_id, prompt_text, intended_use, context, decision, reason_summary,
+               COALESCE(created_at, now())
+        FROM promptrequest_unpartitioned
+    """)
+    op.drop_table('promptrequest_unpartitioned')
+
+    op.create_index('ix_promptrequest_id', 'promptrequest', ['id'], unique=False)
+    op.create_index('ix_promptrequest_user_created_id', 'promptrequest', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER SEQUENCE promptrequest_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE promptrequest RENAME TO promptrequest_partitioned")
+    op.drop_index('ix_promptrequest_id', table_name='promptrequest_partitioned')
+    op.drop_index('ix_promptrequest_user_created_id', table_name='promptrequest_partitioned')
+    op.execute("ALTER TABLE promptrequest_partitioned RENAME CONSTRAINT promptrequest_pkey TO promptrequest_partitioned_pkey")
+
+    op.create_table('promptrequest',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('promptrequest_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('prompt_text', sa.Text(), nullable=False),
+    sa.Column('intended_use', sa.String(), nullable=False),
+    sa.Column('context', sa.Text(), nullable=True),
+    sa.Column('decision', sa.String(), nullable=True),
+    sa.Column('reason_summary', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE promptrequest_id_seq OWNED BY promptrequest.id")
+    op.execute(f"INSERT INTO promptrequest ({COLUMNS}) SELECT {COLUMNS} FROM promptrequest_partitioned")
+    op.execute("DROP TABLE promptrequest_partitioned")
+    op.create_index('ix_promptrequest_id', 'promptrequest', ['id'], unique=False)
+    op.create_index('ix_promptrequest_user_created_id', 'promptrequest', ['user_id', 'created_at', 'id'], unique=False)
+
+    # Evaluations of rows dropped by retention have nothing left to reference
+    op.execute("DELETE FROM promptevaluation WHERE request_id NOT IN (SELECT id FROM promptrequest)")
+    op.create_foreign_key('promptevaluation_request_id_fkey', 'promptevaluation', 'promptrequest', ['request_id'], ['id'])
@@ -0,0 +1,117 @@
+"""Store prompt and context text in deduplicated, compressed blobs
+
+Revision ID: d3f8a6b1c924
+Revises: b7a4c2d9e613
+Create Date: 2026-10-17 09:00:00.000000
+
+promptrequest.prompt_text and .context move to promptblob, one compressed row
+per distinct text keyed by its SHA-256; promptrequest keeps prompt_hash and
+context_hash. Existing rows are backfilled in id order, BATCH_ROWS at a time.
+On PostgreSQL the space of the dropped columns is reclaimed as partitions are
+rewritten or dropped (or by VACUUM FULL).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.compression import BLOB_CODEC, compress, content_hash, decompress
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f8a6b1c924'
+down_revision: Union[str, None] = 'b7a4c2d9e613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_ROWS = 1000
+PREVIEW_CHARS = 120
+
+
+def _blob(text: str) -> dict:
+    raw = text.encode("utf-8")
+    codec, data = compress(raw, BLOB_CODEC)
+    return {"hash": content_hash(text), "codec": codec, "size": len(raw), "preview": text[:PREVIEW_CHARS], "data": data}
+
+
+def upgrade() -> None:
+    op.create_table('promptblob',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('codec', sa.String(length=8), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('preview', sa.String(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('promptrequest', sa.Column('prompt_hash', sa.String(length=64), nullable=True))
+    op.add_column('promptrequest', sa.Column('context_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    blobs = sa.table('promptblob', sa.column('hash'), sa.column('codec'), sa.column('size'),
+                     sa.column('preview'), sa.column('data', sa.LargeBinary))
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, prompt_text, context FROM promptrequest WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_ROWS}).all()
+        if not rows:
+            break
+        texts = {}
+        updates = []
+        for row in rows:
+            prompt_hash = content_hash(row.prompt_text)
+            context_hash = content_hash(row.context) if row.context is not None else None
+            texts[prompt_hash] = row.prompt_text
+            if context_hash:
+                texts[context_hash] = row.context
+            updates.append({"row_id": row.id, "prompt_hash": prompt_hash, "context_hash": context_hash})
+        existing = set(bind.execute(
+            sa.select(blobs.c.hash).where(blobs.c.hash.in_(list(texts)))
+        ).scalars())
+        missing = [_blob(text) for key, text in texts.items() if key not in existing]
+        if missing:
+            bind.execute(blobs.insert(), missing)
+        bind.execute(sa.text(
+            "UPDATE promptrequest SET prompt_hash = :prompt_hash, context_hash = :context_hash WHERE id = :row_id"
+        ), updates)
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('promptrequest') as batch_op:
+        batch_op.alter_column('prompt_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.drop_column('prompt_text')
+        batch_op.drop_column('context')
+
+
+def downgrade() -> None:
+    op.add_column('promptrequest', sa.Column('prompt_text', sa.Text(), nullable=True))
+    op.add_column('promptrequest', sa.Column('context', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT r.id, p.codec AS prompt_codec, p.data AS prompt_data, c.codec AS context_codec, c.data AS context_data "
+            "FROM promptrequest r JOIN promptblob p ON p.hash = r.prompt_hash "
+            "LEFT JOIN promptblob c ON c.hash = r.context_hash "
+            "WHERE r.id > :last_id ORDER BY r.id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_ROWS}).all()
+        if not rows:
+            break
+        bind.execute(sa.text(
+            "UPDATE promptrequest SET prompt_text = :prompt_text, context = :context WHERE id = :row_id"
+        ), [
+            {
+                "row_id": row.id,
+                "prompt_text": decompress(row.prompt_codec, row.prompt_data).decode("utf-8"),
+                "context": decompress(row.context_codec, row.context_data).decode("utf-8") if row.context_codec else None,
+            }
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('promptrequest') as batch_op:
+        batch_op.alter_column('prompt_text', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('context_hash')
+        batch_op.drop_column('prompt_hash')
+    op.drop_table('promptblob')
@@ -0,0 +1,76 @@
+"""Search index over prompt text for admin search
+
+Revision ID: e5b2c7d1a948
+Revises: d3f8a6b1c924
+Create Date: 2026-10-17 12:00:00.000000
+
+PostgreSQL: promptsearch (a tsvector per prompt blob, GIN-indexed) and a
+pg_trgm index on promptrequest.reason_summary; creating the extension needs a
+role allowed to. SQLite: promptsearch is an FTS5 table. Both: indexes on the
+blob hashes of promptrequest. Existing blobs are indexed BATCH_ROWS at a time.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.compression import decompress
+from core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b2c7d1a948'
+down_revision: Union[str, None] = 'd3f8a6b1c924'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_ROWS = 1000
+INDEX_MAX_CHARS = 200_000
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    postgres = bind.dialect.name == 'postgresql'
+
+    op.create_index('ix_promptrequest_prompt_hash', 'promptrequest', ['prompt_hash'], unique=False)
+    op.create_index('ix_promptrequest_context_hash', 'promptrequest', ['context_hash'], unique=False)
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_promptrequest_reason_summary_trgm ON promptrequest USING gin (reason_summary gin_trgm_ops)")
+        op.execute("CREATE TABLE promptsearch (hash VARCHAR(64) PRIMARY KEY, document TSVECTOR NOT NULL)")
+        insert = sa.text(
+            "INSERT INTO promptsearch (hash, document) "
+            "VALUES (:hash, to_tsvector(CAST(:config AS regconfig), :body)) ON CONFLICT (hash) DO NOTHING"
+        )
+    else:
+        op.execute("CREATE VIRTUAL TABLE promptsearch USING fts5(hash UNINDEXED, body, tokenize='unicode61')")
+        insert = sa.text("INSERT INTO promptsearch (hash, body) VALUES (:hash, :body)")
+
+    last_hash = ''
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT hash, codec, data FROM promptblob WHERE hash > :last_hash ORDER BY hash LIMIT :limit"
+        ), {"last_hash": last_hash, "limit": BATCH_ROWS}).all()
+        if not rows:
+            break
+        bind.execute(insert, [
+            {
+                "hash": row.hash,
+                "body": decompress(row.codec, row.data).decode("utf-8")[:INDEX_MAX_CHARS],
+                "config": settings.SEARCH_TEXT_CONFIG,
+            }
+            for row in rows
+        ])
+        last_hash = rows[-1].hash
+
+    # Built after the backfill, which is faster than maintaining it row by row
+    if postgres:
+        op.execute("CREATE INDEX ix_promptsearch_document ON promptsearch USING gin (document)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE promptsearch")
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX ix_promptrequest_reason_summary_trgm")
+    op.drop_index('ix_promptrequest_context_hash', table_name='promptrequest')
+    op.drop_index('ix_promptrequest_prompt_hash', table_name='promptrequest')
@@ -1,34 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, case
-from typing import List, Any
+from sqlalchemy import select, func
+from typing import List, Any, Optional
+from datetime import date, datetime
 
 from db.session import get_db
 from models.user import User
-from models.prompt import PromptRequest
-from schemas.prompt import PromptRequestResponse
+from models.stats import UserStats, UserDailyStats
+from schemas.prompt import PromptHistoryItem, PromptRequestSummary
+from schemas.user import UserAdminUpdate, UserResponse
 from api.rules import get_current_admin
+from services.decision_cache import decision_cache
+from services.principal_cache import principal_cache
+from services.export import MEDIA_TYPES, ExportFormat, export_query, stream_export
+from services.history import DEFAULT_PAGE_SIZE, HistoryFields, MAX_PAGE_SIZE, InvalidCursor, history_page
+from services.search import Decision, search_page, search_terms
 
 router = APIRouter()
 
 @router.get("/users/stats")
 async def get_users_stats(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
     """
     Returns list of users with their prompt statistics (total, accepted, declined).
+    Reads the pre-aggregated counters maintained on the audit write path;
+    `since`/`until` (inclusive, UTC days) restrict them to a date range.
     """
-    # Group by User and count decisions
-    # We want: User Info + Accepted Count + Declined Count
-    
-    # Subquery for stats
-    stmt = select(
-        PromptRequest.user_id,
-        func.count(PromptRequest.id).label("total"),
-        func.sum(case((PromptRequest.decision == "ACCEPT", 1), else_=0)).label("accepted_count"),
-        func.sum(case((PromptRequest.decision == "DECLINE", 1), else_=0)).label("declined_count")
-    ).group_by(PromptRequest.user_id).subquery()
+    if since is None and until is None:
+        stmt = select(
+            UserStats.user_id,
+            UserStats.total,
+            UserStats.accepted_count,
+            UserStats.declined_count
+        ).subquery()
+    else:
+        stmt = select(
+            UserDailyStats.user_id,
+            func.sum(UserDailyStats.total).label("total"),
+            func.sum(UserDailyStats.accepted_count).label("accepted_count"),
+            func.sum(UserDailyStats.declined_count).label("declined_count")
+        )
+        if since is not None:
+            stmt = stmt.where(UserDailyStats.day >= since)
+        if until is not None:
+            stmt = stmt.where(UserDailyStats.day <= until)
+        stmt = stmt.group_by(UserDailyStats.user_id).subquery()
     
     # Join with User table
     query = select(
@@ -53,18 +74,110 @@ async def get_users_stats(
         })
     return stats
 
-@router.get("/users/{user_id}/history", response_model=List[PromptRequestResponse])
+@router.get("/users/{user_id}/history", response_model=List[PromptHistoryItem])
 async def get_user_history(
     user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: HistoryFields = "full",
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Returns a specific user's prompt history, newest first, paginated like
+    GET /prompts/history (X-Next-Cursor header).
+    """
+    try:
+        rows, next_cursor = await history_page(db, user_id, limit, cursor, fields)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@router.get("/search", response_model=List[PromptRequestSummary])
+async def search_history(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500),
+    decision: Optional[Decision] = None,
+    user_id: Optional[int] = None,
+    rule_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
     """
-    Returns full prompt history for a specific user.
+    Finds prompts of all users whose text or context contains `q` (all words,
+    or "a quoted phrase"), or whose reason summary contains it. Optional
+    filters: decision, user_id, rule_id (triggered rule) and a [since, until)
+    time range. Newest first, paginated like history (X-Next-Cursor header).
+    """
+    q = q.strip()
+    if not search_terms(q):
+        raise HTTPException(status_code=400, detail="Search query has no search terms")
+    try:
+        rows, next_cursor = await search_page(
+            db, q, decision=decision, user_id=user_id, rule_id=rule_id,
+            since=since, until=until, limit=limit, cursor=cursor,
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@router.get("/export")
+async def export_history(
+    format: ExportFormat = "ndjson",
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Streams prompt history with decisions and evaluation traces as NDJSON or
+    CSV, oldest first. Optional filters: user_id and a [since, until) time range.
     """
-    result = await db.execute(
-        select(PromptRequest)
-        .where(PromptRequest.user_id == user_id)
-        .order_by(PromptRequest.created_at.desc())
+    query = export_query(user_id=user_id, since=since, until=until)
+    filename = f"prompt-history.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream_export(format, query),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return result.scalars().all()
+
+@router.patch("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: int,
+    user_in: UserAdminUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Changes a user's role or deactivates them. Takes effect immediately on this
+    worker and within PRINCIPAL_CACHE_TTL_SECONDS on others.
+    """
+    if user_in.role is not None and user_in.role not in ("user", "admin"):
+        raise HTTPException(status_code=400, detail="Role must be 'user' or 'admin'")
+    user = await db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    for field, value in user_in.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(user, field, value)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate(user_id)
+    return user
+
+@router.get("/decision-cache/stats")
+async def get_decision_cache_stats(current_user: User = Depends(get_current_admin)):
+    """
+    Returns hit/miss counters of this worker's decision cache.
+    """
+    return decision_cache.stats()
@@ -7,7 +7,7 @@ from datetime import timedelta
 from db.session import get_db
 from models.user import User
 from schemas.user import UserCreate, UserResponse, Token
-from core.security import get_password_hash, verify_password, create_access_token
+from core.security import hash_password, verify_and_update_password, create_access_token
 from core.config import settings
 
 router = APIRouter()
@@ -23,7 +23,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
         )
     user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await hash_password(user_in.password),
         role="user" # Default role
     )
     db.add(user)
@@ -35,10 +35,17 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login_access_token(db: AsyncSession = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalars().first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    if new_hash:
+        # Hashed with outdated argon2 parameters: upgrade while we have the password
+        user.hashed_password = new_hash
+        await db.commit()
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -1,16 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
 
 from db.session import get_db
 from models.user import User
-from models.prompt import PromptRequest
-from schemas.prompt import PromptRequestCreate, PromptRequestResponse
+from models.prompt import PromptRequest, PromptEvaluation
+from schemas.prompt import PromptRequestCreate, PromptBatchCreate, PromptRequestResponse, PromptHistoryItem
 from services.rule_engine import RuleEngine
-from core.security import verify_password
+from services.executor import ExecutorBusy
+from services.rate_limit import ADMISSION_REJECTED, Overloaded, evaluation_limiter, rate_limiter
+from services.principal_cache import principal_cache
+from services.audit_writer import audit_writer
+from services.user_stats import record_decisions
+from services.history import DEFAULT_PAGE_SIZE, HistoryFields, MAX_PAGE_SIZE, InvalidCursor, history_page
+from core.metrics import DB_SECONDS
+import time
+from core.security import decode_access_token
 from core.config import settings
-from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer
 
 router = APIRouter()
@@ -22,26 +33,70 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
+    user_id: str = payload.get("sub")
+    if user_id is None:
         raise credentials_exception
     
-    result = await db.execute(select(User).where(User.id == int(user_id)))
-    user = result.scalars().first()
-    if user is None:
+    try:
+        user_id = int(user_id)
+    except ValueError:
         raise credentials_exception
+
+    user = principal_cache.get(user_id)
+    if user is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        # Detach so the cached instance can be shared by later requests
+        db.expunge(user)
+        principal_cache.set(user)
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Inactive user")
     return user
 
+def build_evaluation(evaluation: dict) -> PromptEvaluation:
+    """The audit row for an engine result: triggered rules, the timing trace and the classifier outcome."""
+    llm = evaluation.get("llm") or {}
+    return PromptEvaluation(
+        llm_model=llm.get("model"),
+        llm_status=llm.get("status"),
+        llm_latency_ms=llm.get("latency_ms"),
+        classification_json={"labels": llm["labels"], "cached": llm.get("cached", False)} if llm else None,
+        triggered_rules_json=evaluation["triggered_rules"],
+        trace_json={**evaluation["trace"], "timed_out_rules": evaluation["timed_out_rules"]},
+    )
+
+async def check_rate_limit(user: User, cost: int = 1):
+    wait = await rate_limiter.acquire(user, cost)
+    if wait:
+        ADMISSION_REJECTED.inc(reason="rate_limit")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": str(math.ceil(wait))})
+
+@asynccontextmanager
+async def evaluation_slot():
+    """Holds one of the worker's evaluation slots; 503 when none frees up in time."""
+    try:
+        async with evaluation_limiter.slot():
+            yield
+    except Overloaded:
+        ADMISSION_REJECTED.inc(reason="concurrency")
+        raise HTTPException(status_code=503, detail="Too many evaluations in flight, retry shortly", headers={"Retry-After": "1"})
+
 @router.post("/evaluate", response_model=PromptRequestResponse)
 async def evaluate_prompt(
     request_in: PromptRequestCreate,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    await check_rate_limit(current_user)
+    async with evaluation_slot():
+        return await _evaluate_one(request_in, current_user, db)
+
+async def _evaluate_one(request_in: PromptRequestCreate, current_user: User, db: AsyncSession):
     # 1. Evaluate
     engine = RuleEngine(db)
     # Convert schema to temp object or just use fields
@@ -52,26 +107,117 @@ async def evaluate_prompt(
         user_id=current_user.id,
         prompt_text=request_in.prompt_text,
         intended_use=request_in.intended_use,
-        context=request_in.context
+        context=request_in.context,
+        # Set here rather than by the server default so write-behind rows carry
+        # the evaluation time and history cursors see one timestamp format.
+        created_at=datetime.now(timezone.utc)
     )
     
-    evaluation = await engine.evaluate(prompt_request)
+    try:
+        evaluation = await engine.evaluate(prompt_request)
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Rule evaluation is overloaded, retry shortly", headers={"Retry-After": "1"})
     
     prompt_request.decision = evaluation["decision"]
     prompt_request.reason_summary = evaluation["reason_summary"]
-    
+    prompt_request.evaluation = build_evaluation(evaluation)
+
+    if audit_writer.write_behind:
+        # Respond now; the row is flushed with the next batch
+        await audit_writer.submit([prompt_request])
+        return prompt_request
+
+    start = time.perf_counter()
     db.add(prompt_request)
+    await record_decisions(db, [prompt_request])
     await db.commit()
     await db.refresh(prompt_request)
+    DB_SECONDS.observe(time.perf_counter() - start, operation="audit_write")
     
     return prompt_request
 
-@router.get("/history", response_model=List[PromptRequestResponse])
+@router.post("/evaluate/batch", response_model=List[PromptRequestResponse])
+async def evaluate_prompt_batch(
+    batch_in: PromptBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Evaluates up to BATCH_MAX_ITEMS prompts against one rule snapshot and stores
+    them with a single bulk insert and commit. Results are returned in input order.
+    """
+    items = batch_in.items
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.BATCH_MAX_ITEMS} items")
+    total_bytes = sum(
+        len(item.prompt_text.encode()) + len(item.intended_use.encode()) + len((item.context or "").encode())
+        for item in items
+    )
+    if total_bytes > settings.BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.BATCH_MAX_BYTES} bytes")
+
+    await check_rate_limit(current_user, cost=len(items))
+    async with evaluation_slot():
+        return await _evaluate_batch(items, current_user, db)
+
+async def _evaluate_batch(items, current_user: User, db: AsyncSession):
+    # created_at is set here rather than by the server default, so the rows
+    # don't need a refresh (one SELECT each) after the bulk insert.
+    now = datetime.now(timezone.utc)
+    prompt_requests = [
+        PromptRequest(
+            user_id=current_user.id,
+            prompt_text=item.prompt_text,
+            intended_use=item.intended_use,
+            context=item.context,
+            created_at=now,
+        )
+        for item in items
+    ]
+
+    engine = RuleEngine(db)
+    try:
+        evaluations = await engine.evaluate_many(prompt_requests)
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Rule evaluation is overloaded, retry shortly", headers={"Retry-After": "1"})
+
+    for prompt_request, evaluation in zip(prompt_requests, evaluations):
+        prompt_request.decision = evaluation["decision"]
+        prompt_request.reason_summary = evaluation["reason_summary"]
+        prompt_request.evaluation = build_evaluation(evaluation)
+
+    if audit_writer.write_behind:
+        await audit_writer.submit(prompt_requests)
+        return prompt_requests
+
+    start = time.perf_counter()
+    db.add_all(prompt_requests)
+    await record_decisions(db, prompt_requests)
+    await db.commit()
+    DB_SECONDS.observe(time.perf_counter() - start, operation="audit_write_batch")
+
+    return prompt_requests
+
+@router.get("/history", response_model=List[PromptHistoryItem])
 async def get_history(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: HistoryFields = "full",
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Returns the current user's history, newest first, one page at a time.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page;
+    the header is absent on the last page.
+    """
     # If admin, show all? MVP says users see own. Admin dashboard separate.
     # For now, just user's own history.
-    result = await db.execute(select(PromptRequest).where(PromptRequest.user_id == current_user.id).order_by(PromptRequest.created_at.desc()))
-    return result.scalars().all()
+    try:
+        rows, next_cursor = await history_page(db, current_user.id, limit, cursor, fields)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
@@ -1,3 +1,6 @@
+import asyncio
+import os
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -6,23 +9,63 @@ from typing import List
 from db.session import get_db
 from models.user import User
 from models.rule import Rule
-from schemas.rule import RuleCreate, RuleResponse
+from schemas.rule import BacktestRequest, RuleCreate, RuleUpdate, RuleResponse
 from api.prompts import get_current_user
+from services.rule_engine import rule_registry
+from services.rule_events import publish as publish_rule_change
+from services.regex_safety import check_pattern
+from services.matcher import resolve_backend, supports_re2
+from services.backtest import from_request, run_backtest
+from core.config import settings
 
 router = APIRouter()
 
+# One backtest at a time per worker: each one occupies a process pool
+_backtest_lock = asyncio.Lock()
+
 # Dependency to check if user is admin
 def get_current_admin(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     return current_user
 
+def validate_rule(rule_in: RuleCreate):
+    """
+    Rejects REGEX rules that are invalid or prone to catastrophic backtracking,
+    LLM rules without a classifier label and SEMANTIC rules without examples.
+    """
+    if rule_in.type == "LLM":
+        label = rule_in.payload_json.get("label")
+        if not isinstance(label, str) or not label:
+            raise HTTPException(status_code=400, detail="LLM rules need a 'label' in payload_json")
+        return
+    if rule_in.type == "SEMANTIC":
+        examples = rule_in.payload_json.get("examples")
+        if not isinstance(examples, list) or not examples or not all(isinstance(e, str) and e.strip() for e in examples):
+            raise HTTPException(status_code=400, detail="SEMANTIC rules need a non-empty 'examples' list in payload_json")
+        threshold = rule_in.payload_json.get("threshold")
+        if threshold is not None and not (isinstance(threshold, (int, float)) and 0 < threshold <= 1):
+            raise HTTPException(status_code=400, detail="SEMANTIC 'threshold' must be a number in (0, 1]")
+        return
+    if rule_in.type != "REGEX":
+        return
+    pattern = rule_in.payload_json.get("pattern")
+    if not isinstance(pattern, str) or not pattern:
+        raise HTTPException(status_code=400, detail="REGEX rules need a 'pattern' in payload_json")
+    problems = check_pattern(pattern)
+    if problems:
+        raise HTTPException(status_code=400, detail="Unsafe pattern: " + "; ".join(problems))
+    if resolve_backend(settings.RULE_MATCH_BACKEND) == "re2" and not supports_re2(pattern):
+        raise HTTPException(status_code=400, detail="Pattern is not supported by the linear-time RE2 backend")
+
 @router.post("/", response_model=RuleResponse)
 async def create_rule(
     rule_in: RuleCreate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
+    validate_rule(rule_in)
+
     # Check uniqueness
     result = await db.execute(select(Rule).where(Rule.name == rule_in.name))
     if result.scalars().first():
@@ -37,8 +80,39 @@ async def create_rule(
         is_active=rule_in.is_active
     )
     db.add(rule)
+    await db.flush()
+    # Other workers rebuild their rule sets once the transaction commits
+    await publish_rule_change(db, rule.id)
     await db.commit()
     await db.refresh(rule)
+    rule_registry.bump()
+    return rule
+
+@router.put("/{rule_id}", response_model=RuleResponse)
+async def update_rule(
+    rule_id: int,
+    rule_in: RuleUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    rule = await db.get(Rule, rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    validate_rule(rule_in)
+
+    if rule_in.name != rule.name:
+        result = await db.execute(select(Rule).where(Rule.name == rule_in.name))
+        if result.scalars().first():
+            raise HTTPException(status_code=400, detail="Rule with this name already exists")
+
+    for field, value in rule_in.model_dump().items():
+        setattr(rule, field, value)
+    # Version + updated_at key the compiled rule cache in the rule engine
+    rule.version = (rule.version or 1) + 1
+    await publish_rule_change(db, rule.id)
+    await db.commit()
+    await db.refresh(rule)
+    rule_registry.bump()
     return rule
 
 @router.get("/", response_model=List[RuleResponse])
@@ -48,3 +122,29 @@ async def read_rules(
 ):
     result = await db.execute(select(Rule))
     return result.scalars().all()
+
+@router.post("/backtest")
+async def backtest_rules(
+    request: BacktestRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Replays stored prompt history (optionally one user's, in a [since, until)
+    range) against the active rules and against a candidate set: the active
+    rules plus `rules` (an `id` replaces that rule) minus `disable_rule_ids`.
+    Reports the requests newly declined and newly accepted, with the most
+    frequent examples, and hits per rule. Nothing is changed.
+    """
+    for rule in request.rules:
+        validate_rule(rule)
+    if _backtest_lock.locked():
+        raise HTTPException(status_code=503, detail="A backtest is already running, retry later", headers={"Retry-After": "30"})
+    async with _backtest_lock:
+        snapshot = await rule_registry.get(db)
+        candidates, disable = from_request(request)
+        return await run_backtest(
+            db, snapshot.rules, candidates, disable,
+            user_id=request.user_id, since=request.since, until=request.until,
+            workers=settings.BACKTEST_WORKERS or os.cpu_count() or 1,
+        )
@@ -0,0 +1,105 @@
+"""
+Micro-benchmarks of RuleEngine.evaluate across rule counts and prompt sizes.
+
+Runs the engine on a fixed in-memory rule snapshot with the decision cache
+off and matching inline, so the numbers are pure matching cost. Pass
+--cache to also time repeated prompts served from the decision cache.
+
+Run from the backend directory:
+    python -m benchmarks.bench_engine [--rules 10,100,1000] [--sizes 256,4096,65536] [--json out.json]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+# Settings need a database URL even though nothing here touches the database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from benchmarks.common import latency_metrics, prompt_text, rule_payloads, write_results  # noqa: E402
+import models.user  # noqa: E402,F401
+from models.prompt import PromptRequest  # noqa: E402
+from models.rule import Rule  # noqa: E402
+from services.decision_cache import DecisionCache  # noqa: E402
+from services.executor import RuleExecutor  # noqa: E402
+from services.rule_engine import RuleEngine, build_snapshot, compile_rule  # noqa: E402
+
+
+class _FixedRegistry:
+    def __init__(self, rules):
+        self.snapshot = build_snapshot(0, tuple(rule.key for rule in rules), rules)
+
+    async def get(self, db):
+        return self.snapshot
+
+
+def make_rules(count: int, rng: random.Random):
+    return [
+        compile_rule(Rule(id=i + 1, name=f"bench-{i + 1}", type=rule_type, severity="BLOCK" if i % 3 == 0 else "WARN",
+                          version=1, payload_json=payload))
+        for i, (rule_type, payload) in enumerate(rule_payloads(count, rng))
+    ]
+
+
+async def bench(rule_count: int, size: int, repeat: int, mode: str, cached: bool, rng: random.Random) -> dict:
+    rules = make_rules(rule_count, rng)
+    start = time.perf_counter()
+    registry = _FixedRegistry(rules)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    cache = DecisionCache(max_entries=1000, ttl_seconds=3600) if cached else None
+    engine = RuleEngine(None, registry=registry, mode=mode, executor=RuleExecutor(mode="inline"), cache=cache, classifier=None)
+    # Distinct prompts, unless we are measuring cache hits
+    prompts = [prompt_text(size, rng) for _ in range(1 if cached else min(repeat, 20))]
+
+    await engine.evaluate(PromptRequest(prompt_text=prompts[0], intended_use="bench"))  # warm-up
+    latencies = []
+    for i in range(repeat):
+        request = PromptRequest(prompt_text=prompts[i % len(prompts)], intended_use="bench")
+        start = time.perf_counter()
+        await engine.evaluate(request)
+        latencies.append(time.perf_counter() - start)
+
+    metrics = latency_metrics(latencies)
+    metrics["mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 3)
+    metrics["snapshot_build_ms"] = round(build_ms, 1)
+    return {
+        "name": f"evaluate/{mode}/{'cached' if cached else 'uncached'}/rules={rule_count}/chars={size}",
+        "params": {"rules": rule_count, "prompt_chars": size, "mode": mode, "cached": cached, "repeat": repeat},
+        "metrics": metrics,
+    }
+
+
+def _ints(value: str):
+    return [int(part) for part in value.split(",") if part]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    results = []
+    print(f"{'rules':>6} {'chars':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'build ms':>9}")
+    for rule_count in args.rules:
+        for size in args.sizes:
+            result = await bench(rule_count, size, args.repeat, args.mode, args.cache, rng)
+            metrics = result["metrics"]
+            print(f"{rule_count:>6} {size:>7} {metrics['p50_ms']:>9.3f} {metrics['p95_ms']:>9.3f} "
+                  f"{metrics['p99_ms']:>9.3f} {metrics['snapshot_build_ms']:>9.1f}")
+            results.append(result)
+    write_results(args.json, "engine", results, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=_ints, default=[10, 100, 1000])
+    parser.add_argument("--sizes", type=_ints, default=[256, 4096, 65536])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--mode", choices=("full-audit", "first-block"), default="full-audit")
+    parser.add_argument("--cache", action="store_true", help="Time repeated prompts served from the decision cache")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Login throughput under concurrency, and how much a login burst delays other
+requests on the same worker (event-loop stall).
+
+Runs the app in-process over ASGI against a throwaway SQLite database, so it
+measures the handler and hashing cost rather than the network. `--inline`
+hashes on the event loop, as the handlers did before hashing was offloaded.
+
+Run from the backend directory:
+    python -m benchmarks.bench_login [--concurrency 16] [--requests 200] [--inline] [--json out.json]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import latency_metrics, percentile, write_results
+
+
+async def run(args):
+    from httpx import ASGITransport, AsyncClient
+
+    import core.security as security
+    from db.session import engine
+    from main import app
+    from models.base import Base
+    import models.user, models.rule, models.prompt, models.stats  # noqa: F401
+
+    if args.inline:
+        async def inline_verify(plain, hashed):
+            return security.pwd_context.verify_and_update(plain, hashed)
+
+        async def inline_hash(password):
+            return security.pwd_context.hash(password)
+
+        import api.auth
+        api.auth.verify_and_update_password = inline_verify
+        api.auth.hash_password = inline_hash
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"username": "bench@example.com", "password": "bench-password"}
+        await client.post("/api/v1/auth/register", json={"email": credentials["username"], "password": credentials["password"]})
+
+        latencies, stalls = [], []
+        remaining = args.requests
+        done = asyncio.Event()
+
+        async def login_worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                response = await client.post("/api/v1/auth/login", data=credentials)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        async def health_probe():
+            # A cheap request issued every 10ms; its latency is the event-loop stall
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                stalls.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        probe = asyncio.create_task(health_probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe
+
+    mode = "inline" if args.inline else f"thread pool ({security.settings.PASSWORD_HASH_WORKERS} workers)"
+    print(f"hashing: {mode}, concurrency {args.concurrency}, {len(latencies)} logins")
+    print(f"logins/sec: {len(latencies) / elapsed:.1f}")
+    print(f"login ms   p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  p99 {percentile(latencies, 99):.1f}")
+    print(f"probe ms   p50 {percentile(stalls, 50):.1f}  p95 {percentile(stalls, 95):.1f}  max {max(stalls) * 1000:.1f}"
+          f"  (mean {statistics.mean(stalls) * 1000:.1f})")
+
+    probe = latency_metrics(stalls)
+    metrics = latency_metrics(latencies, elapsed)
+    metrics.update(probe_p50_ms=probe["p50_ms"], probe_p95_ms=probe["p95_ms"])
+    name = f"login/{'inline' if args.inline else 'offloaded'}/c={args.concurrency}"
+    write_results(args.json, "login", [{"name": name, "params": {"concurrency": args.concurrency, "inline": args.inline}, "metrics": metrics}])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--inline", action="store_true", help="Hash on the event loop (pre-offload behaviour)")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Must be set before the app (and its engine) is imported
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        sys.path.insert(0, os.getcwd())
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
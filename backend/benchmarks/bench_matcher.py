@@ -0,0 +1,87 @@
+"""
+Compares per-rule `re.search` (the old evaluate loop) with the single-pass
+MultiPatternMatcher at 10, 100 and 1,000 rules.
+
+Run from the backend directory:
+    python -m benchmarks.bench_matcher [--prompt-words 200] [--repeat 200] [--json out.json]
+"""
+import argparse
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import latency_metrics, random_word, rule_payloads, write_results
+from services.matcher import MultiPatternMatcher, keyword_list
+
+RULE_COUNTS = (10, 100, 1000)
+
+
+def make_rules(count, rng):
+    return [
+        SimpleNamespace(id=i + 1, type=rule_type, payload=payload)
+        for i, (rule_type, payload) in enumerate(rule_payloads(count, rng))
+    ]
+
+
+def per_rule_scan(rules, text):
+    hits = set()
+    for rule in rules:
+        if rule.type == "REGEX":
+            if re.search(rule.payload["pattern"], text, re.IGNORECASE):
+                hits.add(rule.id)
+        elif rule.type == "KEYWORD":
+            lowered = text.lower()
+            if any(kw.lower() in lowered for kw in keyword_list(rule.payload)):
+                hits.add(rule.id)
+    return hits
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latency_metrics(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompt-words", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text = " ".join(random_word(rng, rng.randint(3, 9)) for _ in range(args.prompt_words))
+
+    results = []
+    print(f"{'rules':>6} {'per-rule p50 ms':>16} {'single-pass p50 ms':>19} {'build ms':>9} {'speedup':>8}")
+    for count in RULE_COUNTS:
+        rules = make_rules(count, rng)
+        # Plant a few hits so both paths do real work
+        planted = text + " " + " ".join(keyword_list(r.payload)[0] for r in rules[::max(1, count // 5)] if r.type == "KEYWORD")
+
+        start = time.perf_counter()
+        matcher = MultiPatternMatcher(rules)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        assert matcher.scan(planted) == per_rule_scan(rules, planted)
+        baseline = timed(lambda: per_rule_scan(rules, planted), args.repeat)
+        single = timed(lambda: matcher.scan(planted), args.repeat)
+        print(f"{count:>6} {baseline['p50_ms']:>16.3f} {single['p50_ms']:>19.3f} {build_ms:>9.1f} "
+              f"{baseline['p50_ms'] / max(single['p50_ms'], 0.001):>7.1f}x")
+        single["build_ms"] = round(build_ms, 1)
+        for name, metrics in (("per-rule", baseline), ("single-pass", single)):
+            results.append({
+                "name": f"matcher/{name}/rules={count}",
+                "params": {"rules": count, "prompt_words": args.prompt_words, "repeat": args.repeat},
+                "metrics": metrics,
+            })
+    write_results(args.json, "matcher", results, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
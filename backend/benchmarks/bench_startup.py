@@ -0,0 +1,112 @@
+"""
+Worker cold start: time to import the app, and time from the start of the
+lifespan until the warm-up has finished (what /ready waits for).
+
+Each run is a fresh interpreter, so nothing is cached in sys.modules; the OS
+file cache is warm after the first run. `--top` lists the modules with the
+highest cumulative import time (python -X importtime) in the last run.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup [--runs 5] [--rules 100] [--top 15] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import write_results
+
+# Runs in the child interpreter; prints one JSON line with its timings
+CHILD = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+
+import asyncio, json, random
+
+async def run():
+    from db.session import AsyncSessionLocal, engine
+    from models.base import Base
+    from models.rule import Rule
+    from benchmarks.common import rule_payloads
+    import models.user, models.prompt, models.stats  # noqa: F401
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        if not await db.scalar(Rule.__table__.select().limit(1)):
+            db.add_all(Rule(name=f"rule-{i}", type=kind, payload_json=payload, severity="BLOCK", is_active=True)
+                       for i, (kind, payload) in enumerate(rule_payloads(RULES, random.Random(7))))
+            await db.commit()
+
+    start = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        await main.warm_up.wait()
+        ready = time.perf_counter() - start
+        steps = main.warm_up.status()["steps"]
+    print(json.dumps({"import_s": imported, "ready_s": ready, "steps": steps}))
+
+asyncio.run(run())
+"""
+
+
+def run_child(rules: int, env: dict, importtime: bool = False) -> tuple:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", f"RULES = {rules}\n" + CHILD]
+    result = subprocess.run(command, capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_imports(stderr: str, count: int) -> list:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only top-level packages and this repo's modules, not every submodule
+        depth = len(name) - len(name.lstrip())
+        if depth <= 3:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list (0: none)")
+    parser.add_argument("--database-url", help="Defaults to a throwaway SQLite database")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        env["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        runs = [run_child(args.rules, env)[0] for _ in range(args.runs)]
+        stderr = run_child(args.rules, env, importtime=True)[1] if args.top else ""
+
+    imports = [run["import_s"] * 1000 for run in runs]
+    readies = [run["ready_s"] * 1000 for run in runs]
+    print(f"{args.runs} cold starts, {args.rules} rules")
+    print(f"import ms   median {statistics.median(imports):.0f}  min {min(imports):.0f}  max {max(imports):.0f}")
+    print(f"ready ms    median {statistics.median(readies):.0f}  min {min(readies):.0f}  max {max(readies):.0f}")
+    for step in runs[0]["steps"]:
+        print(f"  {step:<10} median {statistics.median(run['steps'][step] * 1000 for run in runs):.0f} ms")
+    if stderr:
+        print("slowest imports (cumulative ms):")
+        for millis, name in top_imports(stderr, args.top):
+            print(f"  {millis:8.1f}  {name}")
+
+    metrics = {
+        "import_ms": statistics.median(imports),
+        "ready_ms": statistics.median(readies),
+        "startup_ms": statistics.median(i + r for i, r in zip(imports, readies)),
+    }
+    write_results(args.json, "startup", [{"name": f"startup/rules={args.rules}", "params": {"rules": args.rules}, "metrics": metrics}])
+
+
+if __name__ == "__main__":
+    main()
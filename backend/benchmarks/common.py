@@ -0,0 +1,90 @@
+"""
+Shared helpers for the benchmark scripts: percentiles, synthetic rules and
+machine-readable results.
+
+Every script accepts `--json PATH` and writes:
+
+    {"benchmark": "...", "meta": {...}, "results": [{"name": ..., "params": {...}, "metrics": {...}}]}
+
+Metric names ending in `_ms` are lower-is-better; `rps` is higher-is-better.
+`python -m benchmarks.compare old.json new.json` flags regressions between two runs.
+"""
+import json
+import platform
+import random
+import string
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of `values` (seconds), returned in milliseconds."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def latency_metrics(latencies, elapsed: Optional[float] = None) -> dict:
+    metrics = {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+    if elapsed:
+        metrics["rps"] = round(len(latencies) / elapsed, 1)
+    return metrics
+
+
+def random_word(rng: random.Random, length: int = 7) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def rule_payloads(count: int, rng: random.Random) -> List[tuple]:
+    """(type, payload) pairs: half REGEX, half KEYWORD, like a typical rule table."""
+    rules = []
+    for i in range(count):
+        if i % 2:
+            rules.append(("REGEX", {"pattern": rf"\b{random_word(rng)}\s+{random_word(rng, 5)}\b"}))
+        else:
+            rules.append(("KEYWORD", {"keywords": [random_word(rng), random_word(rng)]}))
+    return rules
+
+
+def prompt_text(chars: int, rng: random.Random) -> str:
+    words = []
+    size = 0
+    while size < chars:
+        word = random_word(rng, rng.randint(3, 9))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: Optional[str], benchmark: str, results: List[dict], **meta):
+    if not path:
+        return
+    document = {
+        "benchmark": benchmark,
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            **meta,
+        },
+        "results": results,
+    }
+    with open(path, "w") as handle:
+        json.dump(document, handle, indent=2)
+    print(f"Wrote {path}")
@@ -0,0 +1,76 @@
+"""
+Compares two benchmark result files (written with --json) and exits non-zero
+if any metric regressed by more than the threshold.
+
+Results are matched by name. Metrics ending in `_ms` regress when they grow,
+`rps` when it shrinks. Only the --metrics list (p50 and throughput by default;
+tail percentiles are noisy on short runs) can fail the comparison; the rest
+are shown for information.
+
+Run from the backend directory:
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10] [--metrics p50_ms,rps]
+"""
+import argparse
+import json
+import sys
+
+
+def _direction(metric: str) -> int:
+    """+1 if higher is worse, -1 if lower is worse, 0 if informational."""
+    if metric.endswith("_ms"):
+        return 1
+    if metric == "rps":
+        return -1
+    return 0
+
+
+def compare(baseline: dict, candidate: dict, threshold_pct: float, gated=("p50_ms", "rps")):
+    """Returns (rows, regressions); each row is (name, metric, old, new, change_pct, regressed)."""
+    old_results = {result["name"]: result["metrics"] for result in baseline["results"]}
+    rows, regressions = [], 0
+    for result in candidate["results"]:
+        old_metrics = old_results.get(result["name"])
+        if old_metrics is None:
+            continue
+        for metric, new in result["metrics"].items():
+            old = old_metrics.get(metric)
+            direction = _direction(metric)
+            if old is None or not direction:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            regressed = metric in gated and change * direction > threshold_pct
+            regressions += regressed
+            rows.append((result["name"], metric, old, new, change, regressed))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    parser.add_argument("--metrics", default="p50_ms,rps", help="Comma-separated metrics that can fail the comparison")
+    args = parser.parse_args()
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)
+    if baseline.get("benchmark") != candidate.get("benchmark"):
+        sys.exit(f"Different benchmarks: {baseline.get('benchmark')} vs {candidate.get('benchmark')}")
+
+    rows, regressions = compare(baseline, candidate, args.threshold, tuple(args.metrics.split(",")))
+    if not rows:
+        sys.exit("No results in common")
+    width = max(len(name) for name, *_ in rows)
+    metric_width = max(len(metric) for _, metric, *_ in rows)
+    for name, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {metric:<{metric_width}} {old:>10.3f} -> {new:>10.3f}  {change:+7.1f}%{flag}")
+    print(f"{regressions} regression(s) over {args.threshold:g}% "
+          f"({baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Operational commands, run from the backend directory:
+
+    python -m cli rebuild-user-stats
+    python -m cli ensure-partitions [--months-ahead N]
+    python -m cli apply-retention [--keep-months N] [--archive]
+    python -m cli backtest REQUEST.json [--workers N] [--output REPORT.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from core.config import settings
+from db.session import AsyncSessionLocal
+from services.partitions import PartitioningUnavailable
+# Register every mapped class before queries resolve relationships
+import models.user, models.rule, models.prompt, models.stats  # noqa: F401
+
+
+async def rebuild_user_stats(args):
+    from services.user_stats import rebuild
+
+    async with AsyncSessionLocal() as db:
+        await rebuild(db)
+    print("User stats rebuilt from prompt history")
+
+
+async def ensure_partitions(args):
+    from services.partitions import ensure_partitions
+
+    async with AsyncSessionLocal() as db:
+        created = await ensure_partitions(db, args.months_ahead)
+    print(f"Created {len(created)} partitions" + (": " + ", ".join(m.isoformat() for m in created) if created else ""))
+
+
+async def apply_retention(args):
+    from services.partitions import apply_retention
+
+    async with AsyncSessionLocal() as db:
+        names = await apply_retention(db, args.keep_months, archive=args.archive)
+    action = "Archived" if args.archive else "Dropped"
+    print(f"{action} {len(names)} partitions" + (": " + ", ".join(names) if names else ""))
+
+
+async def backtest(args):
+    from fastapi import HTTPException
+
+    from api.rules import validate_rule
+    from schemas.rule import BacktestRequest
+    from services.backtest import from_request, run_backtest
+    from services.rule_engine import rule_registry
+
+    with open(args.request) as handle:
+        request = BacktestRequest.model_validate(json.load(handle))
+    try:
+        for rule in request.rules:
+            validate_rule(rule)
+    except HTTPException as exc:
+        raise SystemExit(f"Invalid candidate rule: {exc.detail}")
+    candidates, disable = from_request(request)
+    async with AsyncSessionLocal() as db:
+        snapshot = await rule_registry.load(db)
+        report = await run_backtest(
+            db, snapshot.rules, candidates, disable,
+            user_id=request.user_id, since=request.since, until=request.until,
+            workers=args.workers,
+        )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output)
+    else:
+        print(output)
+    print(
+        f"{report['requests']} requests ({report['prompts']} distinct prompts) in {report['elapsed_seconds']}s: "
+        f"{report['newly_declined']['requests']} newly declined, {report['newly_accepted']['requests']} newly accepted",
+        file=sys.stderr,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-user-stats", help="Recompute the user stats counters from prompt history")
+    rebuild.set_defaults(handler=rebuild_user_stats)
+
+    ensure = commands.add_parser("ensure-partitions", help="Create upcoming monthly promptrequest partitions (PostgreSQL)")
+    ensure.add_argument("--months-ahead", type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD)
+    ensure.set_defaults(handler=ensure_partitions)
+
+    retention = commands.add_parser(
+        "apply-retention", help="Roll up, then drop or archive promptrequest partitions past retention (PostgreSQL)"
+    )
+    retention.add_argument("--keep-months", type=int, default=settings.AUDIT_RETENTION_MONTHS)
+    retention.add_argument("--archive", action="store_true", help="Detach expired partitions instead of dropping them")
+    retention.set_defaults(handler=apply_retention)
+
+    replay = commands.add_parser(
+        "backtest", help="Replay prompt history against candidate rules (same JSON body as POST /rules/backtest)"
+    )
+    replay.add_argument("request", help="JSON file: {\"rules\": [...], \"disable_rule_ids\": [...], \"since\": ...}")
+    replay.add_argument("--workers", type=int, default=settings.BACKTEST_WORKERS or os.cpu_count() or 1)
+    replay.add_argument("--output", help="Write the report here instead of stdout")
+    replay.set_defaults(handler=backtest)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(args.handler(args))
+    except PartitioningUnavailable as exc:
+        parser.exit(1, f"{exc}\n")
+
+
+if __name__ == "__main__":
+    main()
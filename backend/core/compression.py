@@ -0,0 +1,69 @@
+"""
+Codecs for compressed text storage (prompt blobs).
+
+"zlib" is always available; "zstd" compresses faster at a similar ratio but
+needs the optional `zstandard` package. Data that does not shrink is stored
+as "raw". The codec is recorded next to each payload, so the configured codec
+can change at any time without rewriting existing rows.
+"""
+import hashlib
+import logging
+import zlib
+from typing import Tuple
+
+from core.config import settings
+
+try:  # Optional, only needed for the "zstd" codec
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("raw", "zlib", "zstd")
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 (hex) of the UTF-8 text; the key blobs are deduplicated on."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def resolve_codec(codec: str) -> str:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed; compressing with zlib")
+        return "zlib"
+    return codec
+
+
+def compress(data: bytes, codec: str) -> Tuple[str, bytes]:
+    """Returns (codec used, payload)."""
+    if codec == "zstd":
+        packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    elif codec == "zlib":
+        packed = zlib.compress(data, ZLIB_LEVEL)
+    else:
+        return "raw", data
+    if len(packed) >= len(data):
+        return "raw", data
+    return codec, packed
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "raw":
+        return payload
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read zstd-compressed data")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+# Codec for new blobs, checked once at startup
+BLOB_CODEC = resolve_codec(settings.PROMPT_BLOB_CODEC)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Spotixx AI Governance Gateway"
@@ -7,15 +7,126 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     
     DATABASE_URL: str
+    # Log every SQL statement (development only)
+    DB_ECHO: bool = False
+    # Connection pool, per worker process (ignored for SQLite)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800 # -1 disables
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg prepared statements cached per connection; 0 behind PgBouncer in transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    
+    # Seconds between attempts of a failed warm-up step (/ready stays 503 meanwhile)
+    WARMUP_RETRY_SECONDS: float = 5.0
     
     # Security
     SECRET_KEY: str = "CHANGE_THIS_IN_PRODUCTION_SECRET_KEY"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # argon2 cost parameters (memory in KiB). Stored hashes with other values are
+    # upgraded on the next successful login.
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    # Threads hashing/verifying passwords per worker
+    PASSWORD_HASH_WORKERS: int = 2
+    # How long an authenticated user is served from memory instead of the DB. 0 disables.
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30.0
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = None
-    
+
+    # LLM classifier stage for LLM rules: "stub" (local, deterministic) or "openai". None disables.
+    LLM_CLASSIFIER_BACKEND: Optional[str] = None
+    LLM_MODEL: str = "gpt-4o-mini"
+    LLM_MAX_CONCURRENCY: int = 8 # backend calls in flight per worker
+    LLM_TIMEOUT_SECONDS: float = 3.0 # per backend call
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 1.0 # wait for a concurrency slot before giving up (OVERLOADED)
+    # Consecutive failures that open the circuit, and how long it stays open
+    LLM_CIRCUIT_FAILURES: int = 5
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0
+    LLM_CACHE_SIZE: int = 10000
+    LLM_CACHE_TTL_SECONDS: float = 3600.0
+
+    # Rule engine
+    # Seconds between fingerprint checks of the rule table: the fallback for rule
+    # changes whose change event was missed (e.g. listener reconnecting). 0 disables.
+    RULE_SET_REFRESH_SECONDS: float = 30.0
+    # PostgreSQL LISTEN/NOTIFY channel announcing rule writes to every worker
+    RULE_CHANGE_CHANNEL: str = "rule_changes"
+    # "full-audit" collects every triggered rule, "first-block" stops at the first BLOCK hit
+    RULE_EVALUATION_MODE: str = "full-audit"
+    # "re" (stdlib), "regex" (enforces RULE_MATCH_TIMEOUT_MS) or "re2" (linear time)
+    RULE_MATCH_BACKEND: str = "re"
+    # Per-rule matching budget. Rules over budget are reported in timed_out_rules.
+    RULE_MATCH_TIMEOUT_MS: float = 50.0
+    # Where matching runs: "inline" (event loop), "thread" or "process" pool
+    RULE_EXECUTOR_MODE: str = "thread"
+    RULE_EXECUTOR_WORKERS: int = 0 # 0 = min(4, CPU count)
+    # Offloaded evaluations allowed in flight before new ones are rejected with 503
+    RULE_EXECUTOR_MAX_PENDING: int = 64
+    # Prompts (prompt_text + context) shorter than this are matched inline
+    RULE_OFFLOAD_MIN_CHARS: int = 4096
+    # SEMANTIC rules: "hashing" (built-in, lexical similarity only) or
+    # "sentence-transformers" (SEMANTIC_MODEL on CPU; pip install -r requirements-semantic.txt)
+    SEMANTIC_EMBEDDER: str = "hashing"
+    SEMANTIC_MODEL: str = "all-MiniLM-L6-v2"
+    SEMANTIC_BATCH_SIZE: int = 64
+    # Default cosine similarity a prompt needs with a rule example; rules may set "threshold"
+    SEMANTIC_THRESHOLD: float = 0.6
+    # Example count from which an IVF index replaces the exhaustive scan, and clusters probed
+    SEMANTIC_ANN_MIN_ROWS: int = 5000
+    SEMANTIC_ANN_PROBES: int = 8
+    # Processes replaying history for POST /rules/backtest and `python -m cli backtest` (0 = CPU count)
+    BACKTEST_WORKERS: int = 0
+
+    # Decision cache (0 entries disables it)
+    DECISION_CACHE_SIZE: int = 10000
+    DECISION_CACHE_TTL_SECONDS: float = 300.0
+    # Optional Redis URL so cached decisions are shared across workers/replicas
+    DECISION_CACHE_REDIS_URL: Optional[str] = None
+
+    # Admission control on /prompts/evaluate. Token buckets per user, refilled at
+    # RATE_LIMIT_PER_MINUTE (0 disables) and holding RATE_LIMIT_BURST_SECONDS of it;
+    # a batch takes one token per item. Rejected requests get 429 with Retry-After.
+    RATE_LIMIT_PER_MINUTE: float = 600.0
+    RATE_LIMIT_BURST_SECONDS: float = 10.0
+    # Per-user rate by role, overriding RATE_LIMIT_PER_MINUTE (JSON, e.g. {"admin": 3000})
+    RATE_LIMIT_ROLE_PER_MINUTE: Dict[str, float] = {}
+    # Combined rate of all users of a role (JSON, e.g. {"user": 20000}); unset roles are unlimited
+    RATE_LIMIT_ROLE_TOTAL_PER_MINUTE: Dict[str, float] = {}
+    # Optional Redis URL so buckets are shared across workers/replicas
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    # Evaluations in flight per worker (0 = DB_POOL_SIZE + DB_MAX_OVERFLOW); beyond
+    # it requests wait up to EVALUATE_QUEUE_TIMEOUT_SECONDS, then get 503
+    EVALUATE_MAX_CONCURRENCY: int = 0
+    EVALUATE_QUEUE_TIMEOUT_SECONDS: float = 0.5
+
+    # Batch evaluation limits
+    BATCH_MAX_ITEMS: int = 100
+    BATCH_MAX_BYTES: int = 1_000_000 # prompt_text + intended_use + context, UTF-8
+
+    # Audit persistence: "sync" commits before responding (strict audit),
+    # "write-behind" responds first and flushes rows in background batches
+    AUDIT_WRITE_MODE: str = "sync"
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 0.5
+    # When the queue is full: "block" waits for room, "sync" writes the request inline
+    AUDIT_QUEUE_FULL_POLICY: str = "block"
+    # Monthly promptrequest partitions (PostgreSQL): months kept by the retention
+    # job and months created ahead of time by `python -m cli ensure-partitions`
+    AUDIT_RETENTION_MONTHS: int = 12
+    AUDIT_PARTITION_MONTHS_AHEAD: int = 3
+    # Prompt and context text is stored once per distinct text, compressed with
+    # "zlib" or "zstd" (needs the zstandard package, otherwise zlib is used)
+    PROMPT_BLOB_CODEC: str = "zlib"
+    # PostgreSQL text search configuration of the admin search index ("simple"
+    # matches words as written; "english" adds stemming). Changing it needs a reindex.
+    SEARCH_TEXT_CONFIG: str = "simple"
+
     class Config:
         env_file = ".env"
 
@@ -1,16 +1,62 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-from jose import jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Optional, Tuple
 from core.config import settings
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# passlib and jose are imported on first use (or by the startup warm-up), which
+# keeps them off the import path of the app and of the CLI commands.
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+
+    # Hashes made with other parameters still verify, and are flagged for rehashing
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=settings.ARGON2_TIME_COST,
+        argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+        argon2__parallelism=settings.ARGON2_PARALLELISM,
+    )
+
+def __getattr__(name):
+    # `pwd_context` stays importable as a module attribute
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Loads the hashing and token libraries ahead of the first login or request."""
+    get_pwd_context()
+    from jose import jwt  # noqa: F401
+
+# argon2 releases the GIL, so a few threads hash in parallel without blocking
+# the event loop; the fixed size bounds CPU and memory spent on login bursts.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies off the event loop. Returns (valid, new_hash); new_hash is set when
+    the stored hash uses outdated parameters and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_pwd_context().verify_and_update, plain_password, hashed_password)
+
+async def hash_password(password: str) -> str:
+    """get_password_hash, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_pwd_context().hash, password)
+
+def shutdown_hash_executor():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -19,5 +65,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """The token's claims, or None if it is malformed, badly signed or expired."""
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
@@ -1,8 +1,55 @@
+import time
+
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from core.config import settings
+from core.metrics import Gauge, Histogram, registry
+
+DB_POOL_CHECKOUT_SECONDS = registry.register(Histogram(
+    "spotixx_db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the pool.",
+))
+DB_POOL_CONNECTIONS = registry.register(Gauge(
+    "spotixx_db_pool_connections",
+    "Pooled connections by state (in_use, idle, overflow) and configured size.",
+    ["state"],
+))
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+
+def engine_options(database_url: str) -> dict:
+    """create_async_engine keyword arguments for `database_url` from settings."""
+    options = {"echo": settings.DB_ECHO}
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        # SQLAlchemy picks a pool suited to the SQLite file/memory database
+        return options
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+engine = create_async_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -15,3 +62,14 @@ AsyncSessionLocal = sessionmaker(
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+@registry.collector
+def _collect_pool():
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return
+    DB_POOL_CONNECTIONS.set(pool.checkedout(), state="in_use")
+    DB_POOL_CONNECTIONS.set(pool.checkedin(), state="idle")
+    DB_POOL_CONNECTIONS.set(max(pool.overflow(), 0), state="overflow")
+    DB_POOL_CONNECTIONS.set(pool.size(), state="size")
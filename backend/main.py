@@ -1,9 +1,34 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from core.config import settings
-from api import auth, prompts
+from core.security import shutdown_hash_executor
+from api import admin, auth, prompts, rules
+from services.executor import rule_executor
+from services.audit_writer import audit_writer
+from services.rule_events import rule_listener
+from services.warmup import warm_up
+from core.metrics import registry as metrics_registry, REQUEST_SECONDS, STARTUP_SECONDS
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await audit_writer.start()
+    await rule_listener.start()
+    # In the background: the worker serves /health at once and /ready once warm
+    warm_up.start()
+    yield
+    await warm_up.stop()
+    await rule_listener.stop()
+    # Drain queued audit rows before the process exits
+    await audit_writer.stop()
+    rule_executor.shutdown()
+    shutdown_hash_executor()
 
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION, lifespan=lifespan)
 
 # CORS (Allow frontend)
 origins = ["http://localhost:5173", "http://localhost:3000", "*"] # Adjust for prod
@@ -14,16 +39,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep label cardinality bounded
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    return response
+
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(prompts.router, prefix=f"{settings.API_V1_STR}/prompts", tags=["prompts"])
-# New Rule Router
-from api import rules
 app.include_router(rules.router, prefix=f"{settings.API_V1_STR}/rules", tags=["rules"])
-
-# New Admin Analytics Router
-from api import admin
 app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["admin"])
 
 @app.get("/")
@@ -32,4 +67,21 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    # Liveness: answers as soon as the worker runs, warm or not.
+    # Rule-set generation and fingerprint show whether workers agree on the active rules
+    return {"status": "ok", "rule_set": rule_listener.status()}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness: 503 until the warm-up has finished, so traffic only reaches warm workers."""
+    status = {"import_seconds": IMPORT_SECONDS, "warm_up": warm_up.status()}
+    if not warm_up.ready:
+        return JSONResponse({"status": "warming_up", **status}, status_code=503, headers={"Retry-After": "1"})
+    return {"status": "ready", **status}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+IMPORT_SECONDS = round(time.perf_counter() - _import_started, 4)
+STARTUP_SECONDS.set(IMPORT_SECONDS, phase="import")
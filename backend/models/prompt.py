@@ -1,24 +1,102 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index, LargeBinary, event, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, relationship
+from core.compression import BLOB_CODEC, compress, content_hash, decompress
 from models.base import Base
+from models.search import index_texts
+
+# Characters of a blob's text kept uncompressed as its preview
+PREVIEW_CHARS = 120
+# How stale PromptBlob.last_used_at may get before a new reference refreshes it
+BLOB_TOUCH_INTERVAL = timedelta(days=1)
+
+
+class PromptBlob(Base):
+    """
+    Prompt or context text, stored once per distinct text and compressed.
+    Keyed by the SHA-256 of the text, so repeated prompts share one row.
+    """
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(8), nullable=False) # raw, zlib, zstd
+    size = Column(Integer, nullable=False) # Uncompressed UTF-8 bytes
+    preview = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    # Refreshed (at most every BLOB_TOUCH_INTERVAL) when a new row references
+    # the blob; the retention job only prunes blobs idle since its cutoff
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    @property
+    def text(self) -> str:
+        # Decompressed on first access only
+        if "_text" not in self.__dict__:
+            self.__dict__["_text"] = decompress(self.codec, self.data).decode("utf-8")
+        return self.__dict__["_text"]
+
+    @staticmethod
+    def values_for(text: str) -> dict:
+        raw = text.encode("utf-8")
+        codec, data = compress(raw, BLOB_CODEC)
+        return {"hash": content_hash(text), "codec": codec, "size": len(raw), "preview": text[:PREVIEW_CHARS], "data": data}
+
 
 class PromptRequest(Base):
+    __table_args__ = (
+        # Keyset pagination of history (newest first); also serves user_id lookups
+        Index("ix_promptrequest_user_created_id", "user_id", "created_at", "id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("user.id"), nullable=False, index=True)
-    prompt_text = Column(Text, nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    # Text lives in promptblob. Like PromptEvaluation.request_id these foreign
+    # keys only exist in the ORM: blobs are pruned by the retention job.
+    # Indexed for admin search (services.search).
+    prompt_hash = Column(String(64), ForeignKey("promptblob.hash"), nullable=False, index=True)
     intended_use = Column(String, nullable=False)
-    context = Column(Text, nullable=True)
+    context_hash = Column(String(64), ForeignKey("promptblob.hash"), nullable=True, index=True)
     decision = Column(String, nullable=True) # ACCEPT, DECLINE
+    # On PostgreSQL a trigram index (migration e5b2c7d1a948) serves substring search
     reason_summary = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
+
     # Relationships
     user = relationship("User", backref="requests")
     evaluation = relationship("PromptEvaluation", uselist=False, back_populates="request")
+    # Load with selectinload() when the text is needed
+    prompt_blob = relationship("PromptBlob", foreign_keys=[prompt_hash], lazy="raise", viewonly=True)
+    context_blob = relationship("PromptBlob", foreign_keys=[context_hash], lazy="raise", viewonly=True)
+
+    # New rows keep their text in memory until flushed (and after); loaded rows
+    # read it from their blob.
+    @property
+    def prompt_text(self) -> str:
+        if "_prompt_text" in self.__dict__:
+            return self.__dict__["_prompt_text"]
+        return self.prompt_blob.text
+
+    @prompt_text.setter
+    def prompt_text(self, value: str):
+        self.__dict__["_prompt_text"] = value
+        self.prompt_hash = content_hash(value)
+
+    @property
+    def context(self):
+        if "_context" in self.__dict__:
+            return self.__dict__["_context"]
+        return self.context_blob.text if self.context_hash else None
+
+    @context.setter
+    def context(self, value):
+        self.__dict__["_context"] = value
+        self.context_hash = content_hash(value) if value is not None else None
+
 
 class PromptEvaluation(Base):
     id = Column(Integer, primary_key=True, index=True)
+    # On PostgreSQL promptrequest is partitioned by month, so this foreign key
+    # only exists in the ORM (for the relationship), not in the database.
     request_id = Column(Integer, ForeignKey("promptrequest.id"), unique=True, nullable=False)
     llm_model = Column(String, nullable=True)
     llm_status = Column(String, nullable=True) # SUCCESS, FAILED
@@ -26,5 +104,45 @@ class PromptEvaluation(Base):
     classification_json = Column(JSON, nullable=True)
     triggered_rules_json = Column(JSON, nullable=True)
     trace_json = Column(JSON, nullable=True)
-    
+
     request = relationship("PromptRequest", back_populates="evaluation")
+
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@event.listens_for(Session, "before_flush")
+def _store_prompt_blobs(session, flush_context, instances):
+    """
+    Inserts the blobs of new PromptRequest rows (if not stored yet) ahead of
+    the rows themselves, and adds new blobs to the search index.
+    """
+    texts = {}
+    for obj in session.new:
+        if isinstance(obj, PromptRequest):
+            for name in ("_prompt_text", "_context"):
+                text = obj.__dict__.get(name)
+                if text is not None:
+                    texts[content_hash(text)] = text
+    if not texts:
+        return
+
+    connection = session.connection()
+    existing = set(connection.execute(select(PromptBlob.hash).where(PromptBlob.hash.in_(texts))).scalars())
+    new = {key: text for key, text in texts.items() if key not in existing}
+    upsert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if upsert is None:
+        if new:
+            connection.execute(insert(PromptBlob), [PromptBlob.values_for(text) for text in new.values()])
+    else:
+        # Upsert even the blobs seen above: touching an existing blob locks it,
+        # so a concurrent prune cannot delete it from under this transaction.
+        # Sorted, so concurrent writers lock in one order.
+        stmt = upsert(PromptBlob)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["hash"],
+            set_={"last_used_at": func.now()},
+            where=PromptBlob.last_used_at < datetime.now(timezone.utc) - BLOB_TOUCH_INTERVAL,
+        )
+        connection.execute(stmt, [PromptBlob.values_for(texts[key]) for key in sorted(texts)])
+    index_texts(connection, new)
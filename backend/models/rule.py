@@ -6,7 +6,7 @@ class Rule(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
     description = Column(String)
-    type = Column(String, nullable=False) # REGEX, KEYWORD, LLM
+    type = Column(String, nullable=False) # REGEX, KEYWORD, LLM, SEMANTIC
     payload_json = Column(JSON, nullable=False) # e.g. {"pattern": "bomb"}
     severity = Column(String, default="BLOCK") # BLOCK, WARN
     is_active = Column(Boolean, default=True)
@@ -0,0 +1,50 @@
+"""
+Full-text index over prompt blobs (prompt and context text), one entry per blob.
+
+The table is not an ORM model because its shape depends on the database:
+
+* PostgreSQL: promptsearch(hash, document tsvector) with a GIN index.
+* SQLite: promptsearch, an FTS5 virtual table (development and tests).
+
+It is created with the other tables (create_all or the migrations) and filled
+when blobs are first stored; services.search queries it.
+"""
+from typing import Dict
+
+from sqlalchemy import DDL, event, text
+
+from core.config import settings
+from models.base import Base
+
+SEARCH_TABLE = "promptsearch"
+# tsvector values are limited to 1 MB, so very long texts are indexed in part
+INDEX_MAX_CHARS = 200_000
+
+POSTGRES_DDL = (
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (hash VARCHAR(64) PRIMARY KEY, document TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+)
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(hash UNINDEXED, body, tokenize='unicode61')",
+)
+
+for statement in POSTGRES_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "before_drop", DDL(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def index_texts(connection, texts: Dict[str, str]):
+    """Adds `texts` (blob hash -> text) to the index. Runs inside the flush that stores the blobs."""
+    if not texts:
+        return
+    rows = [{"hash": key, "body": value[:INDEX_MAX_CHARS]} for key, value in sorted(texts.items())]
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (hash, document) VALUES (:hash, to_tsvector(CAST(:config AS regconfig), :body)) "
+            "ON CONFLICT (hash) DO NOTHING"
+        ), [{**row, "config": settings.SEARCH_TEXT_CONFIG} for row in rows])
+    elif dialect == "sqlite":
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE} (hash, body) VALUES (:hash, :body)"), rows)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, Date, ForeignKey, UniqueConstraint
+from models.base import Base
+
+class UserStats(Base):
+    """Running per-user decision counters, maintained on the audit write path."""
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    accepted_count = Column(Integer, nullable=False, default=0)
+    declined_count = Column(Integer, nullable=False, default=0)
+
+class UserDailyStats(Base):
+    """Per-user, per-day (UTC) decision counters."""
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_userdailystats_user_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    day = Column(Date, nullable=False, index=True)
+    total = Column(Integer, nullable=False, default=0)
+    accepted_count = Column(Integer, nullable=False, default=0)
+    declined_count = Column(Integer, nullable=False, default=0)
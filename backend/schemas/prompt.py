@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Union
 import datetime
 
 class PromptRequestCreate(BaseModel):
@@ -7,13 +7,17 @@ class PromptRequestCreate(BaseModel):
     intended_use: str
     context: Optional[str] = None
 
+class PromptBatchCreate(BaseModel):
+    items: List[PromptRequestCreate]
+
 class PromptEvaluationResult(BaseModel):
     decision: str # ACCEPT, DECLINE
     reason_summary: str
     triggered_rules: List[int]
+    timed_out_rules: List[int] = []
 
 class PromptRequestResponse(BaseModel):
-    id: int
+    id: Optional[int] # None until persisted when audit writes are deferred
     user_id: int
     prompt_text: str
     intended_use: str
@@ -23,3 +27,18 @@ class PromptRequestResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+class PromptRequestSummary(BaseModel):
+    """History list item without the full prompt text (`fields=summary`)."""
+    id: int
+    user_id: int
+    prompt_preview: str
+    intended_use: str
+    decision: Optional[str]
+    reason_summary: Optional[str]
+    created_at: datetime.datetime
+    
+    class Config:
+        from_attributes = True
+
+PromptHistoryItem = Union[PromptRequestResponse, PromptRequestSummary]
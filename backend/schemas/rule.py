@@ -1,11 +1,11 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 class RuleBase(BaseModel):
     name: str
     description: Optional[str] = None
-    type: str # REGEX, KEYWORD, LLM
+    type: str # REGEX, KEYWORD, LLM, SEMANTIC
     payload_json: Dict[str, Any]
     severity: str = "BLOCK" # BLOCK, WARN
     is_active: bool = True
@@ -23,3 +23,14 @@ class RuleResponse(RuleBase):
     
     class Config:
         from_attributes = True
+
+class BacktestRule(RuleCreate):
+    # Set to try a new version of an existing rule (is_active=False disables it)
+    id: Optional[int] = None
+
+class BacktestRequest(BaseModel):
+    rules: List[BacktestRule] = []
+    disable_rule_ids: List[int] = []
+    user_id: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
@@ -20,6 +20,10 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserAdminUpdate(BaseModel):
+    role: Optional[str] = None # "user" or "admin"
+    is_active: Optional[bool] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,175 @@
+"""
+Write-behind persistence of audit rows.
+
+In "write-behind" mode the evaluate endpoints return the decision as soon as it
+is made and hand the PromptRequest rows (with their PromptEvaluation, if any)
+to a bounded in-process queue. A background task flushes the queue in batches,
+one transaction per batch. Shutdown drains the queue before returning. A batch
+rejected because of its rows (a constraint violation, a bad value) is split in
+halves and retried, so only the rows that fail on their own are dropped.
+
+"sync" mode (the default) keeps the strict-audit behaviour: the row is committed
+before the response is sent. With write-behind, up to AUDIT_QUEUE_SIZE
+evaluations can be lost if the process dies without a clean shutdown.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, StatementError
+
+from core.config import settings
+from core.metrics import DB_SECONDS, registry, Gauge
+from db.session import AsyncSessionLocal
+from services.user_stats import record_decisions
+
+logger = logging.getLogger(__name__)
+
+AUDIT_WRITE_MODES = ("sync", "write-behind")
+# Queue-full policies: wait for room (backpressure) or write this request inline
+QUEUE_FULL_POLICIES = ("block", "sync")
+
+
+class AuditWriter:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        mode: str = "sync",
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        queue_full_policy: str = "block",
+    ):
+        if mode not in AUDIT_WRITE_MODES:
+            raise ValueError(f"Unknown audit write mode: {mode}")
+        if queue_full_policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"Unknown audit queue-full policy: {queue_full_policy}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_full_policy = queue_full_policy
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def write_behind(self) -> bool:
+        return self.mode == "write-behind"
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.write_behind and not self.running:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self):
+        """Flushes everything queued so far, then stops the background task."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, rows: List):
+        """Queues rows for the next batch. Writes inline if the writer is not running."""
+        if not self.running:
+            await self.write(rows)
+            return
+        if self.queue_full_policy == "sync" and self._queue.full():
+            await self.write(rows)
+            return
+        await self._queue.put(rows)
+
+    async def write(self, rows: List):
+        start = time.perf_counter()
+        async with self.session_factory() as session:
+            session.add_all(rows)
+            await record_decisions(session, rows)
+            await session.commit()
+        DB_SECONDS.observe(time.perf_counter() - start, operation="audit_flush")
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.extend(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if stopping:
+                # Drain whatever was queued behind the stop marker
+                while not self._queue.empty():
+                    batch.extend(self._queue.get_nowait() or [])
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List, attempts: int = 3):
+        for attempt in range(1, attempts + 1):
+            try:
+                await self.write(batch)
+                self.flushed += len(batch)
+                return
+            except Exception as exc:
+                if _caused_by_rows(exc):
+                    # Retrying the same rows cannot help; find the bad ones instead
+                    if len(batch) > 1:
+                        middle = len(batch) // 2
+                        await self._flush(batch[:middle], attempts)
+                        await self._flush(batch[middle:], attempts)
+                        return
+                    row = batch[0]
+                    self.failed += 1
+                    logger.error("Dropped audit row (user %s, %s): %s", row.user_id, row.created_at, exc)
+                    return
+                logger.exception("Audit flush of %d rows failed (attempt %d/%d)", len(batch), attempt, attempts)
+                if attempt < attempts:
+                    await asyncio.sleep(0.5 * attempt)
+        self.failed += len(batch)
+        logger.error("Dropped %d audit rows after %d failed flushes", len(batch), attempts)
+
+
+def _caused_by_rows(exc: Exception) -> bool:
+    """Errors due to the rows themselves, as opposed to the database being unavailable."""
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    # Raised before reaching the database, e.g. a value that cannot be bound
+    return isinstance(exc, StatementError) and not isinstance(exc, DBAPIError)
+
+
+audit_writer = AuditWriter(
+    mode=settings.AUDIT_WRITE_MODE,
+    max_queue=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    queue_full_policy=settings.AUDIT_QUEUE_FULL_POLICY,
+)
+
+AUDIT_QUEUE_DEPTH = registry.register(Gauge("spotixx_audit_queue_depth", "Audit row batches waiting to be flushed."))
+
+
+@registry.collector
+def _collect_audit_queue():
+    AUDIT_QUEUE_DEPTH.set(audit_writer.queued)
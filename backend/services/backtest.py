@@ -0,0 +1,224 @@
+"""
+Backtesting candidate rule changes against stored prompt history.
+
+The candidate set is the active rule set with some rules added, replaced or
+disabled. Both sets are compiled with build_snapshot, the same compiled
+matcher the rule engine uses. Each stored prompt is matched once against the
+union of both sets, and the two decisions are read off the hits.
+
+History is read per distinct prompt blob, weighted by how many requests used
+it, so repeated prompts are matched only once. Blobs are streamed in chunks of
+BACKTEST_CHUNK_ROWS and matched in a process pool; workers get the compressed
+text and decompress it themselves. At most two chunks per worker are in
+flight, so memory stays flat however long the history is.
+
+LLM rules need the classifier and are not replayed; the report lists them.
+"""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.compression import decompress
+from models.prompt import PromptBlob, PromptRequest
+from models.rule import Rule
+from services.rule_engine import CompiledRule, build_snapshot, compile_rule
+
+BACKTEST_CHUNK_ROWS = 1000
+# Changed prompts reported per direction, most frequent first
+SAMPLE_SIZE = 20
+
+
+@dataclass
+class CandidateRule:
+    """A rule to add to the candidate set, or, with `replaces`, to swap in for an active rule."""
+    name: str
+    type: str
+    payload: dict
+    severity: str = "BLOCK"
+    replaces: Optional[int] = None
+
+
+@dataclass
+class _Tally:
+    prompts: int = 0
+    requests: int = 0
+    declined_before: int = 0
+    declined_after: int = 0
+    newly_declined: int = 0
+    newly_accepted: int = 0
+    declined_samples: List[dict] = field(default_factory=list)
+    accepted_samples: List[dict] = field(default_factory=list)
+    hits: Dict[int, int] = field(default_factory=dict)
+
+    def merge(self, other: "_Tally"):
+        for name in ("prompts", "requests", "declined_before", "declined_after", "newly_declined", "newly_accepted"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.declined_samples = _top(self.declined_samples + other.declined_samples)
+        self.accepted_samples = _top(self.accepted_samples + other.accepted_samples)
+        for rule_id, count in other.hits.items():
+            self.hits[rule_id] = self.hits.get(rule_id, 0) + count
+
+
+def _top(samples: List[dict]) -> List[dict]:
+    return sorted(samples, key=lambda sample: (-sample["requests"], sample["request_id"]))[:SAMPLE_SIZE]
+
+
+def candidate_set(active: Sequence[CompiledRule], candidates: Iterable[CandidateRule], disable: Iterable[int] = ()) -> Tuple[CompiledRule, ...]:
+    """
+    The active rules with `candidates` applied. Candidate rules get ids above
+    every active rule id, so they never collide with the rules they are compared
+    against (and stay valid in the matcher's named groups).
+    """
+    candidates = list(candidates)
+    removed = set(disable) | {candidate.replaces for candidate in candidates if candidate.replaces is not None}
+    rules = [rule for rule in active if rule.id not in removed]
+    base = max((rule.id for rule in active), default=0)
+    for index, candidate in enumerate(candidates, start=1):
+        rules.append(compile_rule(Rule(
+            id=base + index, name=candidate.name, type=candidate.type, severity=candidate.severity,
+            version=1, payload_json=candidate.payload,
+        )))
+    return tuple(rules)
+
+
+def from_request(request) -> Tuple[List[CandidateRule], List[int]]:
+    """(candidates, rule ids to disable) from a schemas.rule.BacktestRequest."""
+    candidates, disable = [], list(request.disable_rule_ids)
+    for rule in request.rules:
+        if not rule.is_active:
+            if rule.id is not None:
+                disable.append(rule.id)
+            continue
+        candidates.append(CandidateRule(
+            name=rule.name, type=rule.type, payload=rule.payload_json, severity=rule.severity, replaces=rule.id,
+        ))
+    return candidates, disable
+
+
+# Per-process state of the pool workers, set by _init_worker
+_worker: dict = {}
+
+
+def _init_worker(rules: Tuple[CompiledRule, ...], before: frozenset, after: frozenset):
+    _worker.update(
+        snapshot=build_snapshot(0, (), rules),
+        before=before,
+        after=after,
+        blocking=frozenset(rule.id for rule in rules if rule.severity == "BLOCK"),
+    )
+
+
+def _replay_chunk(rows: List[tuple]) -> _Tally:
+    snapshot, before, after, blocking = _worker["snapshot"], _worker["before"], _worker["after"], _worker["blocking"]
+    tally = _Tally()
+    for request_id, requests, preview, codec, data in rows:
+        text = decompress(codec, data).decode("utf-8")
+        hits = snapshot.block_matcher.scan(text) | snapshot.warn_matcher.scan(text)
+        declined_before = bool(hits & before & blocking)
+        declined_after = bool(hits & after & blocking)
+        tally.prompts += 1
+        tally.requests += requests
+        tally.declined_before += requests if declined_before else 0
+        tally.declined_after += requests if declined_after else 0
+        if declined_after != declined_before:
+            sample = {"request_id": request_id, "requests": requests, "prompt_preview": preview}
+            if declined_after:
+                tally.newly_declined += requests
+                tally.declined_samples.append(sample)
+            else:
+                tally.newly_accepted += requests
+                tally.accepted_samples.append(sample)
+        for rule_id in hits:
+            tally.hits[rule_id] = tally.hits.get(rule_id, 0) + requests
+    tally.declined_samples = _top(tally.declined_samples)
+    tally.accepted_samples = _top(tally.accepted_samples)
+    return tally
+
+
+def history_query(user_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """One row per distinct prompt in range: (latest request id, request count, preview, codec, data)."""
+    grouped = select(
+        PromptRequest.prompt_hash,
+        func.max(PromptRequest.id).label("request_id"),
+        func.count(PromptRequest.id).label("requests"),
+    )
+    if user_id is not None:
+        grouped = grouped.where(PromptRequest.user_id == user_id)
+    if since is not None:
+        grouped = grouped.where(PromptRequest.created_at >= since)
+    if until is not None:
+        grouped = grouped.where(PromptRequest.created_at < until)
+    grouped = grouped.group_by(PromptRequest.prompt_hash).subquery()
+    return (
+        select(grouped.c.request_id, grouped.c.requests, PromptBlob.preview, PromptBlob.codec, PromptBlob.data)
+        .join(PromptBlob, PromptBlob.hash == grouped.c.prompt_hash)
+        .execution_options(yield_per=BACKTEST_CHUNK_ROWS)
+    )
+
+
+async def run_backtest(
+    db: AsyncSession,
+    active: Sequence[CompiledRule],
+    candidates: Iterable[CandidateRule],
+    disable: Iterable[int] = (),
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    workers: int = 1,
+) -> dict:
+    """Replays history in range against `active` and the candidate set; returns the diff report."""
+    start = time.perf_counter()
+    after_rules = candidate_set(active, candidates, disable)
+    union = {rule.id: rule for rule in (*active, *after_rules)}
+    replayed = tuple(rule for rule in union.values() if rule.type != "LLM")
+    before_ids = frozenset(rule.id for rule in active)
+    after_ids = frozenset(rule.id for rule in after_rules)
+
+    total = _Tally()
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(replayed, before_ids, after_ids)) as pool:
+        pending = set()
+        result = await db.stream(history_query(user_id, since, until))
+        async for chunk in result.partitions(BACKTEST_CHUNK_ROWS):
+            if len(pending) >= 2 * workers:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+            pending.add(loop.run_in_executor(pool, _replay_chunk, [tuple(row) for row in chunk]))
+        for tally in await asyncio.gather(*pending):
+            total.merge(tally)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "prompts": total.prompts,
+        "requests": total.requests,
+        "declined_before": total.declined_before,
+        "declined_after": total.declined_after,
+        "newly_declined": {"requests": total.newly_declined, "samples": total.declined_samples},
+        "newly_accepted": {"requests": total.newly_accepted, "samples": total.accepted_samples},
+        "rules": [
+            {
+                "rule_id": rule.id if rule.id in before_ids else None,
+                "name": rule.name,
+                "severity": rule.severity,
+                "status": _status(rule, before_ids, after_ids),
+                "hits": total.hits.get(rule.id, 0),
+            }
+            for rule in replayed
+        ],
+        "not_replayed": [rule.name for rule in union.values() if rule.type == "LLM"],
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(total.requests / elapsed, 1) if elapsed else None,
+    }
+
+
+def _status(rule: CompiledRule, before: frozenset, after: frozenset) -> str:
+    if rule.id in before and rule.id in after:
+        return "unchanged"
+    return "removed" if rule.id in before else "added"
@@ -0,0 +1,253 @@
+"""
+Model-based classification stage for LLM rules.
+
+LLM rules carry a taxonomy label in their payload ({"label": "social_scoring",
+"description": "..."}). The classifier asks a backend which of the active labels
+apply to a prompt; each returned label triggers the rules that carry it.
+
+The stage is built so that a slow or failing model never dominates latency:
+
+* a global semaphore caps concurrent backend calls; a call that cannot get
+  a slot within the queue timeout gives up as OVERLOADED,
+* every backend call has a timeout,
+* a circuit breaker skips the backend for a while after repeated failures
+  (timeouts and errors of the backend only: a local queue is not its fault),
+* results are cached by a hash of the prompt and the label set.
+
+Any failure falls back to the rule-only decision and is recorded in
+PromptEvaluation.llm_status.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from core.config import settings
+from core.metrics import LLM_CLASSIFY_SECONDS
+from services.decision_cache import DecisionCache, normalize
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_BACKENDS = ("stub", "openai")
+
+# Values of PromptEvaluation.llm_status
+SUCCESS = "SUCCESS"
+FAILED = "FAILED"
+TIMEOUT = "TIMEOUT"
+CIRCUIT_OPEN = "CIRCUIT_OPEN"
+OVERLOADED = "OVERLOADED"
+SKIPPED = "SKIPPED"
+
+
+@dataclass
+class ClassifierResult:
+    status: str
+    model: Optional[str] = None
+    latency_ms: Optional[int] = None
+    labels: List[str] = field(default_factory=list)
+    cached: bool = False
+
+
+class StubClassifierBackend:
+    """
+    Deterministic local backend for development and tests: a label applies when
+    its words (underscores read as spaces) appear in the prompt.
+    """
+
+    def __init__(self, model: str = "stub", delay_seconds: float = 0.0, fail: bool = False):
+        self.model = model
+        self.delay_seconds = delay_seconds
+        self.fail = fail
+        self.calls = 0
+
+    async def classify(self, text: str, labels: Dict[str, str]) -> List[str]:
+        self.calls += 1
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        if self.fail:
+            raise RuntimeError("Stub classifier failure")
+        lowered = text.lower()
+        return [label for label in labels if label.replace("_", " ").lower() in lowered]
+
+
+class OpenAIClassifierBackend:
+    """Classifies with an OpenAI chat model. Requires the `openai` package."""
+
+    SYSTEM_PROMPT = (
+        "You are a compliance classifier. Given a user prompt and a list of labels "
+        "with descriptions, reply with a JSON object {\"labels\": [...]} listing only "
+        "the labels that clearly apply to the prompt."
+    )
+
+    def __init__(self, api_key: Optional[str], model: str):
+        # Imported here: the package is optional and slow to import (~0.4s)
+        try:
+            from openai import AsyncOpenAI
+        except ImportError:  # pragma: no cover - depends on environment
+            raise RuntimeError("The openai package is required for the openai classifier backend")
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.model = model
+
+    async def classify(self, text: str, labels: Dict[str, str]) -> List[str]:
+        taxonomy = "\n".join(f"- {label}: {description}" for label, description in labels.items())
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": f"Labels:\n{taxonomy}\n\nPrompt:\n{text}"},
+            ],
+        )
+        returned = json.loads(response.choices[0].message.content or "{}").get("labels", [])
+        return [label for label in returned if label in labels]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and stays open for
+    `reset_seconds`; then lets one trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Frees the half-open trial slot of a call that ended without a verdict (cancelled)."""
+        self._trial_running = False
+
+
+class LLMClassifier:
+    def __init__(
+        self,
+        backend,
+        max_concurrency: int = 8,
+        timeout_seconds: float = 3.0,
+        queue_timeout_seconds: float = 1.0,
+        breaker: Optional[CircuitBreaker] = None,
+        cache: Optional[DecisionCache] = None,
+    ):
+        self.backend = backend
+        self.timeout_seconds = timeout_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    def _cache_key(self, text: str, labels: Dict[str, str]) -> str:
+        digest = hashlib.sha256()
+        for part in (self.model, json.dumps(sorted(labels.items())), normalize(text)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def classify(self, text: str, labels: Dict[str, str]) -> ClassifierResult:
+        """Returns the labels (from `labels`, label -> description) that apply to `text`."""
+        key = None
+        if self.cache is not None and self.cache.enabled:
+            key = self._cache_key(text, labels)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return ClassifierResult(status=SUCCESS, model=self.model, latency_ms=0, labels=cached["labels"], cached=True)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            LLM_CLASSIFY_SECONDS.observe(time.perf_counter() - start, status=OVERLOADED)
+            return ClassifierResult(status=OVERLOADED, model=self.model)
+        try:
+            return await self._classify_in_slot(text, labels, key)
+        finally:
+            self._semaphore.release()
+
+    async def _classify_in_slot(self, text: str, labels: Dict[str, str], key: Optional[str]) -> ClassifierResult:
+        if not self.breaker.allow():
+            return ClassifierResult(status=CIRCUIT_OPEN, model=self.model)
+
+        start = time.perf_counter()
+        try:
+            found = await asyncio.wait_for(self.backend.classify(text, labels), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            status, found = TIMEOUT, []
+        except Exception as exc:
+            logger.warning("LLM classifier call failed: %s", exc)
+            status, found = FAILED, []
+        except BaseException:
+            # Cancelled, e.g. the client disconnected: says nothing about the
+            # backend, but a half-open trial must not stay claimed forever
+            self.breaker.release_trial()
+            raise
+        else:
+            status = SUCCESS
+        elapsed = time.perf_counter() - start
+        LLM_CLASSIFY_SECONDS.observe(elapsed, status=status)
+
+        if status == SUCCESS:
+            self.breaker.record_success()
+            if key is not None:
+                await self.cache.set(key, {"labels": found})
+        else:
+            self.breaker.record_failure()
+        return ClassifierResult(status=status, model=self.model, latency_ms=round(elapsed * 1000), labels=found)
+
+
+def build_classifier(backend: Optional[str]) -> Optional[LLMClassifier]:
+    if not backend:
+        return None
+    if backend not in CLASSIFIER_BACKENDS:
+        raise ValueError(f"Unknown LLM classifier backend: {backend}")
+    if backend == "openai":
+        implementation = OpenAIClassifierBackend(settings.OPENAI_API_KEY, settings.LLM_MODEL)
+    else:
+        implementation = StubClassifierBackend()
+    return LLMClassifier(
+        implementation,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+        queue_timeout_seconds=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+        breaker=CircuitBreaker(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_RESET_SECONDS),
+        cache=DecisionCache(max_entries=settings.LLM_CACHE_SIZE, ttl_seconds=settings.LLM_CACHE_TTL_SECONDS),
+    )
+
+
+llm_classifier = build_classifier(settings.LLM_CLASSIFIER_BACKEND)
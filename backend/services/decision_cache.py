@@ -0,0 +1,148 @@
+"""
+Bounded LRU/TTL cache of rule engine decisions.
+
+Entries are keyed on a hash of the exact prompt, intended use and context (the
+text the matchers see: a pattern may well depend on a trailing newline) plus
+the rule-set fingerprint, so any rule change makes old entries unreachable.
+The registry also clears the local cache whenever its generation is bumped.
+An optional Redis backend shares entries across workers and replicas.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from core.config import settings
+from core.metrics import Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Folds line endings and surrounding whitespace, for caches of model verdicts
+    (services.classifier). Rule decisions are keyed on the exact text instead.
+    """
+    if not text:
+        return ""
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def cache_key(fingerprint: Tuple, mode: str, prompt_text: str, intended_use: str, context: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    for part in (repr(fingerprint), mode, prompt_text or "", intended_use or "", context or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RedisCacheBackend:
+    """Shared second-level cache. Requires the optional `redis` package."""
+
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "decision:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl_seconds)))
+
+
+class DecisionCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300, shared=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(value)
+            del self._entries[key]
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception as exc:
+                logger.warning("Shared decision cache unavailable: %s", exc)
+                value = None
+            if value is not None:
+                self.shared_hits += 1
+                self._store(key, value)
+                return _copy(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        self._store(key, _copy(value))
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value)
+            except Exception as exc:
+                logger.warning("Shared decision cache unavailable: %s", exc)
+
+    def _store(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self, *_):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+def _copy(value: dict) -> dict:
+    return {k: list(v) if isinstance(v, list) else v for k, v in value.items()}
+
+
+decision_cache = DecisionCache(
+    max_entries=settings.DECISION_CACHE_SIZE,
+    ttl_seconds=settings.DECISION_CACHE_TTL_SECONDS,
+    shared=(
+        RedisCacheBackend(settings.DECISION_CACHE_REDIS_URL, settings.DECISION_CACHE_TTL_SECONDS)
+        if settings.DECISION_CACHE_REDIS_URL else None
+    ),
+)
+
+DECISION_CACHE_LOOKUPS = registry.register(Gauge(
+    "spotixx_decision_cache_lookups", "Decision cache lookups since start, by result.", ["result"],
+))
+
+
+@registry.collector
+def _collect_decision_cache():
+    DECISION_CACHE_LOOKUPS.set(decision_cache.hits, result="hit")
+    DECISION_CACHE_LOOKUPS.set(decision_cache.shared_hits, result="shared_hit")
+    DECISION_CACHE_LOOKUPS.set(decision_cache.misses, result="miss")
@@ -0,0 +1,82 @@
+"""
+Worker pool for CPU-bound rule matching.
+
+Regex matching over a long prompt is pure CPU work, and running it inside an
+async handler blocks every other request on the same worker. Prompts larger
+than RULE_OFFLOAD_MIN_CHARS are handed to a thread or process pool instead;
+small prompts stay inline, where the hand-off would cost more than the match.
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from core.config import settings
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class ExecutorBusy(Exception):
+    """Raised when too many offloaded evaluations are already pending."""
+
+
+class RuleExecutor:
+    def __init__(self, mode: str = "thread", workers: int = 0, max_pending: int = 64, min_chars: int = 4096):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown rule executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.min_chars = min_chars
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def should_offload(self, size: int) -> bool:
+        return self.mode != "inline" and size >= self.min_chars
+
+    async def run(self, size: int, fn: Callable, *args):
+        """Runs `fn(*args)` inline or on the pool, depending on the input `size` in characters."""
+        if not self.should_offload(size):
+            return fn(*args)
+        # Backpressure: shed load instead of queueing without bound behind the pool
+        if self._pending >= self.max_pending:
+            raise ExecutorBusy(f"{self._pending} rule evaluations already pending")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rule-match")
+        return self._pool
+
+    async def warm_up(self):
+        """Starts the pool's workers now rather than on the first large prompt."""
+        if self.mode == "inline":
+            return
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        # Executors start one worker per queued task, up to max_workers
+        await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+rule_executor = RuleExecutor(
+    mode=settings.RULE_EXECUTOR_MODE,
+    workers=settings.RULE_EXECUTOR_WORKERS,
+    max_pending=settings.RULE_EXECUTOR_MAX_PENDING,
+    min_chars=settings.RULE_OFFLOAD_MIN_CHARS,
+)
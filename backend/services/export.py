@@ -0,0 +1,115 @@
+"""
+Streaming export of audit history.
+
+Rows are read through a server-side cursor in chunks of EXPORT_CHUNK_ROWS and
+serialized as they arrive, so memory use does not grow with the export size;
+CSV is sent in chunks of CSV_FLUSH_ROWS lines. Text cells that a spreadsheet
+would read as a formula (leading =, +, -, @) are prefixed with a quote.
+The generators open their own session: the request-scoped one from get_db is
+closed before a StreamingResponse body is sent. Prompt and context blobs are
+decompressed row by row as they are written.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from core.compression import decompress
+from db.session import AsyncSessionLocal
+from models.prompt import PromptBlob, PromptEvaluation, PromptRequest
+
+EXPORT_CHUNK_ROWS = 1000
+CSV_FLUSH_ROWS = 100
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+COLUMNS = (
+    "id", "user_id", "created_at", "intended_use", "prompt_text", "context",
+    "decision", "reason_summary", "triggered_rules", "trace",
+)
+
+
+def export_query(user_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    prompt_blob = aliased(PromptBlob)
+    context_blob = aliased(PromptBlob)
+    query = (
+        select(
+            PromptRequest.id,
+            PromptRequest.user_id,
+            PromptRequest.created_at,
+            PromptRequest.intended_use,
+            prompt_blob.codec.label("prompt_codec"),
+            prompt_blob.data.label("prompt_data"),
+            context_blob.codec.label("context_codec"),
+            context_blob.data.label("context_data"),
+            PromptRequest.decision,
+            PromptRequest.reason_summary,
+            PromptEvaluation.triggered_rules_json.label("triggered_rules"),
+            PromptEvaluation.trace_json.label("trace"),
+        )
+        .join(prompt_blob, prompt_blob.hash == PromptRequest.prompt_hash)
+        .outerjoin(context_blob, context_blob.hash == PromptRequest.context_hash)
+        .outerjoin(PromptEvaluation, PromptEvaluation.request_id == PromptRequest.id)
+        .order_by(PromptRequest.created_at, PromptRequest.id)
+    )
+    if user_id is not None:
+        query = query.where(PromptRequest.user_id == user_id)
+    if since is not None:
+        query = query.where(PromptRequest.created_at >= since)
+    if until is not None:
+        query = query.where(PromptRequest.created_at < until)
+    return query.execution_options(yield_per=EXPORT_CHUNK_ROWS)
+
+
+def _text(codec: Optional[str], data: Optional[bytes]) -> Optional[str]:
+    return decompress(codec, data).decode("utf-8") if codec else None
+
+
+async def _rows(query) -> AsyncIterator[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for row in result:
+            record = row._asdict()
+            record["prompt_text"] = _text(record["prompt_codec"], record["prompt_data"])
+            record["context"] = _text(record["context_codec"], record["context_data"])
+            record["created_at"] = record["created_at"].isoformat() if record["created_at"] else None
+            yield {name: record[name] for name in COLUMNS}
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def stream_ndjson(query) -> AsyncIterator[str]:
+    async for record in _rows(query):
+        yield json.dumps(record) + "\n"
+
+
+async def stream_csv(query) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    rows = 0
+    async for record in _rows(query):
+        for name in ("triggered_rules", "trace"):
+            if record[name] is not None:
+                record[name] = json.dumps(record[name])
+        writer.writerow(_csv_cell(record[name]) for name in COLUMNS)
+        rows += 1
+        if rows % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_export(fmt: ExportFormat, query) -> AsyncIterator[str]:
+    return stream_csv(query) if fmt == "csv" else stream_ndjson(query)
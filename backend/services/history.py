@@ -0,0 +1,81 @@
+"""
+Keyset pagination over a user's prompt history.
+
+Pages are ordered newest first on (created_at, id) and served by the
+(user_id, created_at, id) index, so page N costs the same as page 1. The
+cursor is an opaque token carrying the (created_at, id) of the last row sent.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models.prompt import PromptBlob, PromptRequest
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+HistoryFields = Literal["full", "summary"]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, request_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), request_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, request_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(request_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+async def history_page(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: HistoryFields = "full",
+) -> Tuple[List, Optional[str]]:
+    """
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    "full" rows are PromptRequest objects with their text blobs loaded (and
+    decompressed on access); "summary" rows leave out prompt_text and carry the
+    blob's stored prompt_preview instead, so nothing is decompressed.
+    """
+    if fields == "summary":
+        query = select(
+            PromptRequest.id,
+            PromptRequest.user_id,
+            PromptRequest.intended_use,
+            PromptRequest.decision,
+            PromptRequest.reason_summary,
+            PromptRequest.created_at,
+            PromptBlob.preview.label("prompt_preview"),
+        ).join(PromptBlob, PromptBlob.hash == PromptRequest.prompt_hash)
+    else:
+        query = select(PromptRequest).options(selectinload(PromptRequest.prompt_blob), selectinload(PromptRequest.context_blob))
+
+    query = query.where(PromptRequest.user_id == user_id)
+    if cursor:
+        created_at, request_id = decode_cursor(cursor)
+        query = query.where(tuple_(PromptRequest.created_at, PromptRequest.id) < tuple_(created_at, request_id))
+    # One extra row tells us whether there is a next page
+    query = query.order_by(PromptRequest.created_at.desc(), PromptRequest.id.desc()).limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = result.scalars().all() if fields == "full" else result.all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
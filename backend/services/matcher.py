@@ -0,0 +1,467 @@
+"""
+Single-pass multi-pattern matching for REGEX, KEYWORD and SEMANTIC rules.
+
+Instead of running one `re.search` per rule, all REGEX rules are merged into one
+pattern and all KEYWORD rules into one Aho-Corasick automaton, so each prompt is
+scanned once per rule type no matter how many rules are active. SEMANTIC rules
+are scored together with one matrix-vector product (see services/semantic.py).
+"""
+import re
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services.regex_safety import is_safe
+
+try:  # Optional C implementation of Aho-Corasick
+    import ahocorasick
+except ImportError:  # pragma: no cover - depends on environment
+    ahocorasick = None
+
+try:  # Optional backtracking engine with per-call timeouts
+    import regex
+except ImportError:  # pragma: no cover - depends on environment
+    regex = None
+
+try:  # Optional linear-time engine (google-re2)
+    import re2
+except ImportError:  # pragma: no cover - depends on environment
+    re2 = None
+
+# "re": stdlib, budget checked after the fact; "regex": budget enforced with
+# timeouts; "re2": linear-time, no catastrophic backtracking possible.
+BACKENDS = ("re", "regex", "re2")
+
+logger = logging.getLogger(__name__)
+
+# Patterns using backreferences, named groups, conditionals or global inline
+# flags cannot be safely merged (group numbers/names would clash, flags must lead
+# the expression), so they are matched on their own.
+_UNMERGEABLE = re.compile(r"\\\d|\(\?P[<=]|\(\?<|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+class RegexMatcher:
+    """
+    Merges many regex rules into one compiled pattern.
+
+    The pattern is `(?=p1|p2|...)(?:(?=(?P<r1>p1)))?(?:(?=(?P<r2>p2)))?...`.
+    The leading guard makes the scanner only stop at positions where at least one
+    rule matches, and the optional lookaheads then record *every* rule matching
+    at that position. Since all matches are zero-width, `finditer` visits every
+    candidate position, so overlapping matches are never shadowed.
+
+    With the "re2" backend, merged rules go into an RE2 set instead, which
+    reports all matching rules in one linear-time pass.
+
+    Patterns that cannot be merged are left in `standalone` for the caller.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[Tuple[int, str]],
+        flags: int = re.IGNORECASE,
+        backend: str = "re",
+        timeout_ms: Optional[float] = None,
+    ):
+        self.flags = flags
+        self.backend = backend
+        self.timeout = timeout_ms / 1000 if timeout_ms and backend == "regex" else None
+        self.engine = regex if backend == "regex" else re
+        self.standalone: List[Tuple[int, re.Pattern]] = []
+        merged: List[Tuple[int, str]] = []
+
+        for rule_id, pattern in patterns:
+            if _UNMERGEABLE.search(pattern) or (backend == "re" and not is_safe(pattern)):
+                # Risky patterns are kept apart so their cost stays attributable
+                self.standalone.append((rule_id, self.engine.compile(pattern, flags)))
+            elif backend == "re2" and not supports_re2(pattern):
+                logger.warning("Rule %s is not RE2-compatible, matching it with the backtracking engine", rule_id)
+                self.standalone.append((rule_id, re.compile(pattern, flags)))
+            else:
+                merged.append((rule_id, pattern))
+
+        self.combined = None
+        self._set = None
+        self._group_rules: List[Tuple[int, int]] = []
+        self._merged = merged
+        if merged and backend == "re2":
+            self._set = _re2_set([p for _, p in merged])
+        elif merged:
+            guard = "|".join(f"(?:{p})" for _, p in merged)
+            body = "".join(f"(?:(?=(?P<r{rule_id}>{p})))?" for rule_id, p in merged)
+            try:
+                self.combined = self.engine.compile(f"(?={guard}){body}", flags)
+            except self.engine.error as exc:
+                logger.warning("Could not merge %d regex rules, matching individually: %s", len(merged), exc)
+                self.standalone.extend((rule_id, self.engine.compile(p, flags)) for rule_id, p in merged)
+                self._merged = merged = []
+        if self.combined is not None:
+            # groups() is 0-based, group numbers are 1-based
+            self._group_rules = [
+                (self.combined.groupindex[f"r{rule_id}"] - 1, rule_id) for rule_id, _ in merged
+            ]
+        self.rule_count = len(self._merged)
+        self.label = "regex"
+
+    def scan(self, text: str, timed_out: Optional[Set[int]] = None) -> Set[int]:
+        hits: Set[int] = set()
+        if self._set is not None:
+            return {self._merged[index][0] for index in self._set.Match(text)}
+        if self.combined is None:
+            return hits
+        pending = self._group_rules
+        try:
+            for match in self._finditer(text):
+                groups = match.groups()
+                remaining = []
+                for index, rule_id in pending:
+                    if groups[index] is not None:
+                        hits.add(rule_id)
+                    else:
+                        remaining.append((index, rule_id))
+                pending = remaining
+                if not pending:
+                    break
+        except TimeoutError:
+            return self._scan_each(text, timed_out)
+        return hits
+
+    def first(self, text: str, timed_out: Optional[Set[int]] = None) -> Optional[int]:
+        """Returns a rule matching at the leftmost candidate position, without scanning further."""
+        if self._set is not None:
+            matched = self._set.Match(text)
+            return self._merged[min(matched)][0] if matched else None
+        if self.combined is None:
+            return None
+        try:
+            match = self._search(self.combined, text)
+        except TimeoutError:
+            hits = self._scan_each(text, timed_out)
+            return min(hits) if hits else None
+        if match is None:
+            return None
+        groups = match.groups()
+        for index, rule_id in self._group_rules:
+            if groups[index] is not None:
+                return rule_id
+        return None
+
+    def _finditer(self, text: str):
+        if self.timeout:
+            return self.combined.finditer(text, timeout=self.timeout)
+        return self.combined.finditer(text)
+
+    def _search(self, pattern, text: str):
+        if self.timeout:
+            return pattern.search(text, timeout=self.timeout)
+        return pattern.search(text)
+
+    def _scan_each(self, text: str, timed_out: Optional[Set[int]]) -> Set[int]:
+        """The merged pass ran out of time: retry rule by rule to find the culprits."""
+        hits: Set[int] = set()
+        for rule_id, pattern in self._merged:
+            try:
+                if self._search(self.engine.compile(pattern, self.flags), text):
+                    hits.add(rule_id)
+            except TimeoutError:
+                if timed_out is not None:
+                    timed_out.add(rule_id)
+        return hits
+
+
+class PatternStage:
+    """
+    A single regex rule that could not be merged.
+
+    With the "regex" backend the search is aborted once it exceeds the budget.
+    The stdlib `re` cannot be interrupted, so there the budget is checked after
+    the fact: the rule still counts, but is reported as over budget.
+    """
+
+    def __init__(self, rule_id: int, pattern, timeout_ms: Optional[float] = None):
+        self.rule_id = rule_id
+        self.pattern = pattern
+        self.rule_count = 1
+        self.label = f"rule:{rule_id}"
+        self.timeout_ms = timeout_ms
+        self._abortable = regex is not None and isinstance(pattern, regex.Pattern)
+
+    def _matches(self, text: str, timed_out: Optional[Set[int]]) -> bool:
+        if not self.timeout_ms:
+            return self.pattern.search(text) is not None
+        if self._abortable:
+            try:
+                return self.pattern.search(text, timeout=self.timeout_ms / 1000) is not None
+            except TimeoutError:
+                if timed_out is not None:
+                    timed_out.add(self.rule_id)
+                return False
+        start = time.perf_counter()
+        matched = self.pattern.search(text) is not None
+        if (time.perf_counter() - start) * 1000 > self.timeout_ms and timed_out is not None:
+            timed_out.add(self.rule_id)
+        return matched
+
+    def scan(self, text: str, timed_out: Optional[Set[int]] = None) -> Set[int]:
+        return {self.rule_id} if self._matches(text, timed_out) else set()
+
+    def first(self, text: str, timed_out: Optional[Set[int]] = None) -> Optional[int]:
+        return self.rule_id if self._matches(text, timed_out) else None
+
+
+def supports_re2(pattern: str) -> bool:
+    """Whether `pattern` can run on the linear-time RE2 engine (no lookarounds/backreferences)."""
+    if re2 is None:
+        return False
+    try:
+        re2.compile(pattern)
+    except Exception:
+        return False
+    return True
+
+
+def _re2_set(patterns: List[str]):
+    options = re2.Options()
+    options.case_sensitive = False
+    pattern_set = re2.Set.SearchSet(options)
+    for pattern in patterns:
+        pattern_set.Add(pattern)
+    pattern_set.Compile()
+    return pattern_set
+
+
+class KeywordAutomaton:
+    """Case-insensitive Aho-Corasick automaton mapping keywords to rule ids."""
+
+    def __init__(self, keywords: Iterable[Tuple[int, str]]):
+        entries = [(rule_id, kw.lower()) for rule_id, kw in keywords if kw]
+        self.rule_count = len({rule_id for rule_id, _ in entries})
+        self.label = "keywords"
+        self._native = None
+        if ahocorasick is not None and entries:
+            self._native = self._build_native(entries)
+        elif entries:
+            self._build(entries)
+        else:
+            self._goto: List[Dict[str, int]] = [{}]
+            self._out: List[Set[int]] = [set()]
+
+    @staticmethod
+    def _build_native(entries):
+        automaton = ahocorasick.Automaton()
+        by_keyword: Dict[str, Set[int]] = {}
+        for rule_id, kw in entries:
+            by_keyword.setdefault(kw, set()).add(rule_id)
+        for kw, rule_ids in by_keyword.items():
+            automaton.add_word(kw, frozenset(rule_ids))
+        automaton.make_automaton()
+        return automaton
+
+    def _build(self, entries):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Set[int]] = [set()]
+        for rule_id, kw in entries:
+            state = 0
+            for ch in kw:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(rule_id)
+
+        # Breadth-first construction of failure links
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        while queue:
+            next_queue = []
+            for state in queue:
+                for ch, nxt in goto[state].items():
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch) != nxt else 0
+                    out[nxt] |= out[fail[nxt]]
+                    next_queue.append(nxt)
+            queue = next_queue
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def scan(self, text: str, timed_out: Optional[Set[int]] = None) -> Set[int]:
+        hits: Set[int] = set()
+        if not self.rule_count:
+            return hits
+        text = text.lower()
+        if self._native is not None:
+            for _, rule_ids in self._native.iter(text):
+                hits |= rule_ids
+            return hits
+
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits |= out[state]
+        return hits
+
+    def first(self, text: str, timed_out: Optional[Set[int]] = None) -> Optional[int]:
+        """Returns a rule for the first keyword found, without scanning further."""
+        if not self.rule_count:
+            return None
+        text = text.lower()
+        if self._native is not None:
+            for _, rule_ids in self._native.iter(text):
+                return min(rule_ids)
+            return None
+
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return min(out[state])
+        return None
+
+
+class StageStats:
+    """Running cost and hit rate of one matching stage, used to order stages."""
+
+    # Weight of the newest sample in the moving average of stage cost
+    ALPHA = 0.1
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.cost_ms = 0.0
+
+    def record(self, elapsed_ms: float, hit: bool):
+        self.calls += 1
+        self.hits += hit
+        if self.calls == 1:
+            self.cost_ms = elapsed_ms
+        else:
+            self.cost_ms += self.ALPHA * (elapsed_ms - self.cost_ms)
+
+    @property
+    def score(self) -> float:
+        """Expected cost per hit; lower runs first. Laplace-smoothed so new stages get tried."""
+        hit_rate = (self.hits + 1) / (self.calls + 2)
+        return self.cost_ms / hit_rate
+
+
+class MultiPatternMatcher:
+    """
+    Scans a prompt once per rule type and returns every triggered rule id.
+
+    Matching is split into stages: the keyword automaton, the merged regex, and
+    one stage per regex that could not be merged. `scan` runs every stage;
+    `first` runs them cheapest-per-hit first and stops at the first hit.
+    """
+
+    def __init__(self, rules: Iterable, backend: str = "re", timeout_ms: Optional[float] = None):
+        backend = resolve_backend(backend)
+        patterns, keywords, semantic = [], [], []
+        for rule in rules:
+            if rule.type == "REGEX":
+                pattern = rule.payload.get("pattern")
+                if pattern and _compiles(rule.id, pattern):
+                    patterns.append((rule.id, pattern))
+            elif rule.type == "KEYWORD":
+                for kw in keyword_list(rule.payload):
+                    keywords.append((rule.id, kw))
+            elif rule.type == "SEMANTIC":
+                semantic.append(rule)
+        self.backend = backend
+        self.regex = RegexMatcher(patterns, backend=backend, timeout_ms=timeout_ms)
+        self.keywords = KeywordAutomaton(keywords)
+
+        stages = [self.keywords, self.regex]
+        if semantic:
+            # Imported lazily: NumPy and embedding models are only needed for SEMANTIC rules
+            from core.config import settings
+            from services.semantic import SemanticMatcher
+
+            stages.append(SemanticMatcher(
+                semantic,
+                threshold=settings.SEMANTIC_THRESHOLD,
+                ann_min_rows=settings.SEMANTIC_ANN_MIN_ROWS,
+                ann_probes=settings.SEMANTIC_ANN_PROBES,
+            ))
+        stages.extend(PatternStage(rule_id, pattern, timeout_ms) for rule_id, pattern in self.regex.standalone)
+        self.stages = [stage for stage in stages if stage.rule_count]
+        self.stats = {id(stage): StageStats() for stage in self.stages}
+
+    def scan(
+        self,
+        text: str,
+        timed_out: Optional[Set[int]] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Set[int]:
+        """
+        Returns every matching rule id. Rules over their time budget are added to
+        `timed_out`; the milliseconds spent per stage are recorded in `timings`.
+        """
+        hits: Set[int] = set()
+        for stage in self.stages:
+            start = time.perf_counter()
+            hits |= stage.scan(text, timed_out)
+            if timings is not None:
+                timings[stage.label] = (time.perf_counter() - start) * 1000
+        return hits
+
+    def first(
+        self,
+        text: str,
+        timed_out: Optional[Set[int]] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Optional[int]:
+        stats = self.stats
+        for stage in sorted(self.stages, key=lambda s: stats[id(s)].score):
+            start = time.perf_counter()
+            rule_id = stage.first(text, timed_out)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stats[id(stage)].record(elapsed_ms, rule_id is not None)
+            if timings is not None:
+                timings[stage.label] = elapsed_ms
+            if rule_id is not None:
+                return rule_id
+        return None
+
+
+def resolve_backend(backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown regex backend: {backend}")
+    if (backend == "regex" and regex is None) or (backend == "re2" and re2 is None):
+        logger.warning("Regex backend %r is not installed, falling back to 're'", backend)
+        return "re"
+    return backend
+
+
+def keyword_list(payload: dict) -> List[str]:
+    """KEYWORD payloads are {"keywords": [...]} or, like REGEX, {"pattern": "..."}."""
+    keywords = payload.get("keywords")
+    if isinstance(keywords, str):
+        return [keywords]
+    if keywords:
+        return [str(k) for k in keywords]
+    if payload.get("pattern"):
+        return [str(payload["pattern"])]
+    return []
+
+
+def _compiles(rule_id: int, pattern: str) -> bool:
+    try:
+        re.compile(pattern)
+    except re.error as exc:
+        logger.warning("Skipping rule %s with invalid pattern %r: %s", rule_id, pattern, exc)
+        return False
+    return True
@@ -0,0 +1,142 @@
+"""
+Monthly partitions of promptrequest (PostgreSQL) and the retention job.
+
+Partitions are named promptrequest_pYYYY_MM and cover one calendar month (UTC)
+of created_at. Retention keeps the last AUDIT_RETENTION_MONTHS months. Before
+an older partition goes, its decision counts are recomputed into
+userdailystats, so the stats endpoints keep reporting the full history.
+Afterwards, prompt blobs no longer referenced by any row (attached or
+archived) are pruned.
+"""
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.search import SEARCH_TABLE
+from services.user_stats import rollup_days
+
+logger = logging.getLogger(__name__)
+
+PARENT = "promptrequest"
+_PARTITION_NAME = re.compile(r"^promptrequest_p(\d{4})_(\d{2})$")
+
+
+class PartitioningUnavailable(RuntimeError):
+    pass
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def retention_cutoff(keep_months: int, today: Optional[date] = None) -> date:
+    """First month that is kept; partitions for earlier months are expired."""
+    today = today or datetime.now(timezone.utc).date()
+    return add_months(today.replace(day=1), -(keep_months - 1))
+
+
+async def _require_partitioned(db: AsyncSession):
+    if db.get_bind().dialect.name != "postgresql":
+        raise PartitioningUnavailable("promptrequest is only partitioned on PostgreSQL")
+    partitioned = await db.scalar(text(
+        "SELECT count(*) FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :parent"
+    ), {"parent": PARENT})
+    if not partitioned:
+        raise PartitioningUnavailable("promptrequest is not partitioned; run the migrations first")
+
+
+async def list_partitions(db: AsyncSession) -> List[date]:
+    """Months that currently have a partition attached, oldest first."""
+    await _require_partitioned(db)
+    result = await db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent"
+    ), {"parent": PARENT})
+    return sorted(month for month in (partition_month(name) for name in result.scalars()) if month)
+
+
+async def ensure_partitions(db: AsyncSession, months_ahead: int = 3) -> List[date]:
+    """Creates missing partitions from the current month up to `months_ahead` later."""
+    existing = set(await list_partitions(db))
+    start = datetime.now(timezone.utc).date().replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(start, offset)
+        if month in existing:
+            continue
+        # Fails if the default partition already holds rows for this month;
+        # those have to be moved by hand before the range can be attached.
+        await db.execute(text(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(month)
+    await db.commit()
+    return created
+
+
+async def apply_retention(db: AsyncSession, keep_months: int, archive: bool = False, today: Optional[date] = None) -> List[str]:
+    """
+    Rolls up and then drops (or, with `archive`, detaches) every partition older
+    than the retention window. Detached partitions stay in the database as plain
+    tables for pg_dump/cold storage. Returns the affected partition names.
+    """
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1")
+    cutoff = retention_cutoff(keep_months, today)
+    expired = [month for month in await list_partitions(db) if month < cutoff]
+    names = []
+    for month in expired:
+        name = partition_name(month)
+        await rollup_days(db, month, add_months(month, 1))
+        if archive:
+            await db.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        else:
+            # promptevaluation has no foreign key to a partitioned table, so clean up by hand
+            await db.execute(text(f"DELETE FROM promptevaluation WHERE request_id IN (SELECT id FROM {name})"))
+            await db.execute(text(f"DROP TABLE {name}"))
+        # One transaction per partition: its rollup and removal succeed or fail together
+        await db.commit()
+        logger.info("%s audit partition %s", "Archived" if archive else "Dropped", name)
+        names.append(name)
+    if names:
+        await prune_blobs(db, datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc))
+    return names
+
+
+async def prune_blobs(db: AsyncSession, idle_before: datetime) -> int:
+    """
+    Deletes prompt blobs unused since `idle_before` that no promptrequest row,
+    nor any archived partition, references. Returns the number deleted.
+    """
+    archived = (await db.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern"
+    ), {"pattern": f"{PARENT}\\_p%"})).scalars().all()
+    conditions = ["b.last_used_at < :idle_before"]
+    for table in [PARENT, *(name for name in archived if partition_month(name))]:
+        conditions.append(f"NOT EXISTS (SELECT 1 FROM {table} r WHERE r.prompt_hash = b.hash)")
+        conditions.append(f"NOT EXISTS (SELECT 1 FROM {table} r WHERE r.context_hash = b.hash)")
+    # Their search index entries go in the same statement
+    pruned = await db.scalar(text(
+        f"WITH pruned AS (DELETE FROM promptblob b WHERE {' AND '.join(conditions)} RETURNING b.hash), "
+        f"unindexed AS (DELETE FROM {SEARCH_TABLE} s USING pruned p WHERE s.hash = p.hash) "
+        "SELECT count(*) FROM pruned"
+    ), {"idle_before": idle_before})
+    await db.commit()
+    logger.info("Pruned %d unreferenced prompt blobs", pruned)
+    return pruned
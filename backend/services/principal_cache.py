@@ -0,0 +1,50 @@
+"""
+Short-TTL cache of authenticated users keyed on the JWT subject.
+
+Saves the `SELECT user` that every authenticated request would otherwise run.
+Entries expire after PRINCIPAL_CACHE_TTL_SECONDS, and are dropped immediately
+when an admin deactivates a user or changes their role on this worker, so a
+revoked user is let through for at most one TTL on other workers.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from core.config import settings
+from models.user import User
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float = 30, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return user
+
+    def set(self, user: User):
+        """`user` must be detached from its session, as it is shared across requests."""
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+principal_cache = PrincipalCache(ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS)
@@ -0,0 +1,212 @@
+"""
+Admission control for prompt evaluation.
+
+Token buckets limit each user, at a rate that may depend on their role, and
+optionally each role as a whole (all of its users together). A request is
+admitted only if every bucket it draws from has enough tokens, and then takes
+from all of them; otherwise it is told how long to wait. A request costing
+more than a bucket holds (a large batch) is admitted once the bucket is full
+and leaves it in debt, so the long-run rate still holds. Buckets live in the
+worker; an optional Redis backend shares them across workers and replicas and
+falls back to the local buckets while Redis is unavailable.
+
+Independently, a concurrency limiter caps evaluations in flight per worker,
+so load is shed with 503 before requests queue up on the DB pool.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+# (bucket key, tokens per second, capacity)
+Limit = Tuple[str, float, float]
+
+
+class Overloaded(Exception):
+    """Raised when no evaluation slot frees up within the queue timeout."""
+
+
+class LocalBuckets:
+    """In-process token buckets, least recently used ones evicted beyond max_keys."""
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, limits: List[Limit], cost: float) -> float:
+        """
+        Takes `cost` from every bucket and returns 0, or takes nothing and returns
+        the seconds to wait. Buckets may go negative when cost exceeds capacity.
+        """
+        now = self.clock()
+        levels = []
+        wait = 0.0
+        for key, rate, capacity in limits:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            levels.append(tokens)
+            needed = min(cost, capacity)
+            if tokens < needed:
+                wait = max(wait, (needed - tokens) / rate)
+        for (key, _, _), tokens in zip(limits, levels):
+            self._buckets[key] = (tokens if wait else tokens - cost, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Same algorithm as LocalBuckets.take, atomic in Redis and on the Redis clock.
+# KEYS: bucket keys; ARGV: cost, then rate and capacity per key.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    levels[i] = tokens
+    local needed = math.min(cost, capacity)
+    if tokens < needed then
+        wait = math.max(wait, (needed - tokens) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    -- A bucket left alone this long is full again (debt included), so it can go
+    local rate = tonumber(ARGV[i * 2])
+    local refill = (tonumber(ARGV[i * 2 + 1]) - math.min(tokens, 0)) / rate
+    redis.call('PEXPIRE', key, math.ceil(refill * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared through Redis. Requires the optional `redis` package."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, limits: List[Limit], cost: float) -> float:
+        args = [cost]
+        for _, rate, capacity in limits:
+            args += [rate, capacity]
+        wait = await self._take(keys=[self.prefix + key for key, _, _ in limits], args=args)
+        return float(wait)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        per_minute: float = 0,
+        burst_seconds: float = 10,
+        role_per_minute: Optional[Dict[str, float]] = None,
+        role_total_per_minute: Optional[Dict[str, float]] = None,
+        shared=None,
+    ):
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.role_per_minute = role_per_minute or {}
+        self.role_total_per_minute = role_total_per_minute or {}
+        self.shared = shared
+        self.local = LocalBuckets()
+
+    def _limit(self, key: str, per_minute: float) -> Limit:
+        rate = per_minute / 60
+        return key, rate, max(1.0, rate * self.burst_seconds)
+
+    def limits_for(self, user) -> List[Limit]:
+        limits = []
+        per_minute = self.role_per_minute.get(user.role, self.per_minute)
+        if per_minute > 0:
+            limits.append(self._limit(f"user:{user.id}", per_minute))
+        role_total = self.role_total_per_minute.get(user.role, 0)
+        if role_total > 0:
+            limits.append(self._limit(f"role:{user.role}", role_total))
+        return limits
+
+    async def acquire(self, user, cost: int = 1) -> float:
+        """0 if the request is admitted, else the seconds until it would be."""
+        limits = self.limits_for(user)
+        if not limits:
+            return 0.0
+        if self.shared is not None:
+            try:
+                return await self.shared.take(limits, cost)
+            except Exception as exc:
+                logger.warning("Shared rate limiter unavailable, using local buckets: %s", exc)
+        return self.local.take(limits, cost)
+
+
+class ConcurrencyLimiter:
+    """Caps evaluations in flight; a request waits up to queue_timeout for a slot."""
+
+    def __init__(self, limit: int, queue_timeout: float = 0.5):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            yield
+            return
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(f"{self.in_flight} evaluations already in flight")
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+rate_limiter = RateLimiter(
+    per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    burst_seconds=settings.RATE_LIMIT_BURST_SECONDS,
+    role_per_minute=settings.RATE_LIMIT_ROLE_PER_MINUTE,
+    role_total_per_minute=settings.RATE_LIMIT_ROLE_TOTAL_PER_MINUTE,
+    shared=RedisBuckets(settings.RATE_LIMIT_REDIS_URL) if settings.RATE_LIMIT_REDIS_URL else None,
+)
+evaluation_limiter = ConcurrencyLimiter(
+    settings.EVALUATE_MAX_CONCURRENCY or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+    settings.EVALUATE_QUEUE_TIMEOUT_SECONDS,
+)
+
+ADMISSION_REJECTED = registry.register(Counter(
+    "spotixx_admission_rejected_total", "Evaluation requests rejected before evaluation, by reason.", ["reason"],
+))
+EVALUATIONS_IN_FLIGHT = registry.register(Gauge(
+    "spotixx_evaluations_in_flight", "Evaluation requests holding a concurrency slot.",
+))
+
+
+@registry.collector
+def _collect_admission():
+    EVALUATIONS_IN_FLIGHT.set(evaluation_limiter.in_flight)
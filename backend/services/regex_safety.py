@@ -0,0 +1,227 @@
+"""
+Static checks for admin-supplied regex patterns.
+
+Python's `re` is a backtracking engine, so patterns such as `(a+)+$` or
+`(a|aa)*$` can take exponential time on a crafted prompt. These checks reject
+the common shapes of catastrophic backtracking when a rule is created:
+
+* nested quantifiers whose characters overlap, e.g. `(a+)+`, `(\\w+\\s?)*`
+* repeated alternations whose branches can start with the same character,
+  e.g. `(a|aa)*`, `(\\d+|\\w+)*`, or that repeat a branch, e.g. `(a|a)*`
+* repeated groups that can match the empty string, e.g. `(a|b?)+`
+
+The analysis is conservative rather than complete; the per-rule time budget in
+the matcher is the runtime backstop.
+"""
+import re
+from typing import List, Optional
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+_SAFE_REPEATS = {getattr(sre_constants, "POSSESSIVE_REPEAT", None)}
+_ATOMIC = getattr(sre_constants, "ATOMIC_GROUP", None)
+_ZERO_WIDTH = {sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+_CATEGORY_TESTS = {
+    sre_constants.CATEGORY_DIGIT: str.isdigit,
+    sre_constants.CATEGORY_SPACE: str.isspace,
+    sre_constants.CATEGORY_WORD: lambda c: c.isalnum() or c == "_",
+}
+
+# A first-character set containing this may start with (almost) anything
+_WILDCARD = "<any>"
+
+# Groups repeated at least this many times are checked for ambiguity, e.g. `(.*a){20}`
+REPEAT_CONTEXT_THRESHOLD = 10
+MAX_PATTERN_LENGTH = 2000
+
+NESTED_QUANTIFIERS = "Nested quantifiers can cause catastrophic backtracking"
+OVERLAPPING_ALTERNATION = "Repeated alternation with overlapping branches can cause catastrophic backtracking"
+
+
+def check_pattern(pattern: str, flags: int = re.IGNORECASE) -> List[str]:
+    """Returns a list of problems with `pattern`; empty if it is considered safe."""
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return [f"Pattern is longer than {MAX_PATTERN_LENGTH} characters"]
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error as exc:
+        return [f"Invalid regular expression: {exc}"]
+
+    problems: List[str] = []
+    _walk(list(parsed), None, problems)
+    return problems
+
+
+def is_safe(pattern: str) -> bool:
+    return not check_pattern(pattern)
+
+
+def _walk(items, follow: Optional[set], problems: List[str]):
+    """
+    `follow` is the set of characters that may come right after `items` while
+    still inside a repeated group (None outside of any repetition). Inside a
+    repetition, a variable-length quantifier or alternation whose characters
+    overlap what follows it can split the same input in exponentially many ways.
+    """
+    for index, (op, av) in enumerate(items):
+        rest = items[index + 1:]
+        item_follow = None
+        if follow is not None:
+            item_follow = _first_chars(rest) | (follow if _nullable(rest) else set())
+
+        if op in _REPEATS:
+            min_count, max_count, body = av
+            body = list(body)
+            body_first = _first_chars(body)
+            variable = min_count != max_count
+            # `(a?)*`, `(a|b?)+`: every empty iteration is another way to split the input
+            if max_count > 1 and body and _nullable(body):
+                _add(problems, NESTED_QUANTIFIERS)
+            if variable and item_follow is not None and not _nullable(body) and _overlap(body_first, item_follow):
+                _add(problems, NESTED_QUANTIFIERS)
+            if max_count >= REPEAT_CONTEXT_THRESHOLD:
+                _walk(body, body_first | (item_follow or set()), problems)
+            else:
+                _walk(body, item_follow, problems)
+        elif op in _SAFE_REPEATS or op == _ATOMIC:
+            # Possessive quantifiers and atomic groups never backtrack into their body
+            continue
+        elif op == sre_constants.SUBPATTERN:
+            _walk(list(av[-1]), item_follow, problems)
+        elif op == sre_constants.BRANCH:
+            alternatives = [list(alternative) for alternative in av[1]]
+            if item_follow is not None and _branch_is_ambiguous(alternatives, item_follow):
+                _add(problems, OVERLAPPING_ALTERNATION)
+            for alternative in alternatives:
+                _walk(alternative, item_follow, problems)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _walk(list(av[1]), None, problems)
+
+
+def _add(problems: List[str], message: str):
+    if message not in problems:
+        problems.append(message)
+
+
+def _branch_is_ambiguous(alternatives, follow: set) -> bool:
+    # sre_parse factors a common prefix out of the branch, so `(a|a)` arrives as
+    # `a(?:|)`: an empty or repeated alternative matches the same text twice
+    if any(not alternative for alternative in alternatives):
+        return True
+    if len({repr(alternative) for alternative in alternatives}) < len(alternatives):
+        return True
+    firsts = [_first_chars(alternative) for alternative in alternatives]
+    for i, first in enumerate(firsts):
+        for other in firsts[i + 1:]:
+            if _overlap(first, other):
+                return True
+    # `(a|)` behaves like `a?`: ambiguous if what follows can also start with `a`
+    if any(_nullable(alternative) for alternative in alternatives):
+        return _overlap(set().union(*firsts), follow)
+    return False
+
+
+def _first_chars(items) -> set:
+    """Approximate set of characters a sequence can start with."""
+    first = set()
+    for op, av in items:
+        if op in _ZERO_WIDTH:
+            continue
+        if op == sre_constants.LITERAL:
+            first.add(chr(av).lower())
+        elif op == sre_constants.IN:
+            first |= _class_tokens(av)
+        elif op in _REPEATS or op in _SAFE_REPEATS:
+            first |= _first_chars(list(av[2]))
+            if av[0] == 0 or _nullable(list(av[2])):
+                continue
+        elif op in (sre_constants.SUBPATTERN, _ATOMIC):
+            body = list(av[-1]) if op == sre_constants.SUBPATTERN else list(av)
+            first |= _first_chars(body)
+            if _nullable(body):
+                continue
+        elif op == sre_constants.BRANCH:
+            for alternative in av[1]:
+                first |= _first_chars(list(alternative))
+            if any(_nullable(list(alternative)) for alternative in av[1]):
+                continue
+        else:
+            # ANY, NOT_LITERAL, backreferences...
+            first.add(_WILDCARD)
+        return first
+    return first
+
+
+def _class_tokens(items) -> set:
+    tokens = set()
+    for kind, value in items:
+        if kind == sre_constants.LITERAL:
+            tokens.add(chr(value).lower())
+        elif kind == sre_constants.RANGE:
+            low, high = value
+            tokens.add(("range", low, high))
+            # Ranges are matched case-insensitively too
+            if chr(low).isalpha() and chr(high).isalpha():
+                tokens.add(("range", ord(chr(low).lower()), ord(chr(high).lower())))
+        elif kind == sre_constants.CATEGORY and value in _CATEGORY_TESTS:
+            tokens.add(("category", value))
+        else:
+            # Negated classes and negated categories
+            return {_WILDCARD}
+    return tokens
+
+
+def _overlap(first: set, other: set) -> bool:
+    if not first or not other:
+        return False
+    if _WILDCARD in first or _WILDCARD in other:
+        return True
+    return any(_tokens_overlap(a, b) for a in first for b in other)
+
+
+def _tokens_overlap(a, b) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return a == b
+    if isinstance(b, str):
+        a, b = b, a
+    if isinstance(a, str):
+        if b[0] == "range":
+            return b[1] <= ord(a) <= b[2]
+        return _CATEGORY_TESTS[b[1]](a)
+    if a[0] == "range" and b[0] == "range":
+        return a[1] <= b[2] and b[1] <= a[2]
+    if a[0] == "category" and b[0] == "category":
+        return a[1] == b[1] or {a[1], b[1]} == {sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_DIGIT}
+    low, high, category = (a[1], a[2], b[1]) if a[0] == "range" else (b[1], b[2], a[1])
+    test = _CATEGORY_TESTS[category]
+    return any(test(chr(code)) for code in range(low, min(high, low + 512) + 1))
+
+
+def _nullable(items) -> bool:
+    """Whether the sequence can match the empty string."""
+    for op, av in items:
+        if op in _ZERO_WIDTH:
+            continue
+        if op in _REPEATS or op in _SAFE_REPEATS:
+            if av[0] > 0 and not _nullable(list(av[2])):
+                return False
+            continue
+        if op == sre_constants.SUBPATTERN:
+            if not _nullable(list(av[-1])):
+                return False
+            continue
+        if op == _ATOMIC:
+            if not _nullable(list(av)):
+                return False
+            continue
+        if op == sre_constants.BRANCH:
+            if not any(_nullable(list(alternative)) for alternative in av[1]):
+                return False
+            continue
+        return False
+    return True
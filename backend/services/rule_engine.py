@@ -1,49 +1,411 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 from models.rule import Rule
 from models.prompt import PromptRequest
+from core.config import settings
+from services.matcher import MultiPatternMatcher
+from services.executor import RuleExecutor, rule_executor
+from services.decision_cache import DecisionCache, cache_key, decision_cache
+from services.classifier import LLMClassifier, SKIPPED, llm_classifier
+from core.metrics import RULE_MATCH_SECONDS
+import asyncio
 import re
-import json
+import time
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Immutable, pre-compiled view of a Rule row, safe to share across requests."""
+    id: int
+    name: str
+    type: str
+    severity: str
+    version: int
+    updated_at: Optional[datetime]
+    payload: Dict[str, Any]
+    pattern: Optional[re.Pattern] = None
+
+    @property
+    def key(self) -> Tuple[int, int, Optional[datetime]]:
+        return (self.id, self.version, self.updated_at)
+
+
+@dataclass(frozen=True)
+class RuleSnapshot:
+    """A consistent set of compiled active rules for one rule-set generation."""
+    generation: int
+    fingerprint: Tuple
+    rules: Tuple[CompiledRule, ...] = field(default_factory=tuple)
+    block_matcher: Optional[MultiPatternMatcher] = None
+    warn_matcher: Optional[MultiPatternMatcher] = None
+    # LLM rules, decided by the classifier stage rather than the matchers
+    llm_rules: Tuple[CompiledRule, ...] = field(default_factory=tuple)
+
+
+def build_snapshot(generation: int, fingerprint: Tuple, rules) -> RuleSnapshot:
+    rules = tuple(rules)
+    options = dict(backend=settings.RULE_MATCH_BACKEND, timeout_ms=settings.RULE_MATCH_TIMEOUT_MS)
+    return RuleSnapshot(
+        generation=generation,
+        fingerprint=fingerprint,
+        rules=rules,
+        block_matcher=MultiPatternMatcher((r for r in rules if r.severity == "BLOCK"), **options),
+        warn_matcher=MultiPatternMatcher((r for r in rules if r.severity != "BLOCK"), **options),
+        llm_rules=tuple(r for r in rules if r.type == "LLM" and r.payload.get("label")),
+    )
+
+
+def compile_rule(rule: Rule) -> CompiledRule:
+    payload = rule.payload_json or {}
+    pattern = None
+    if rule.type == "REGEX" and payload.get("pattern"):
+        try:
+            pattern = re.compile(payload["pattern"], re.IGNORECASE)
+        except re.error:
+            pattern = None
+    return CompiledRule(
+        id=rule.id,
+        name=rule.name,
+        type=rule.type,
+        severity=rule.severity or "BLOCK",
+        version=rule.version or 1,
+        updated_at=rule.updated_at,
+        payload=dict(payload),
+        pattern=pattern,
+    )
+
+
+class RuleSetRegistry:
+    """
+    Process-wide holder of the compiled active rule set.
+
+    Rules are loaded once and reused by every request until the generation is
+    bumped (on writes through the rules API) or, as a safety net for changes made
+    by other workers, until a cheap fingerprint check over the rule table's
+    version/updated_at columns notices a difference.
+    Snapshots are immutable, so swapping `_snapshot` is atomic for readers.
+    Changes made elsewhere are built before the generation is bumped, so
+    requests keep the previous snapshot meanwhile. After a write in this
+    worker, requests wait for the new generation (one shared load) and so
+    always see the write.
+    """
+
+    def __init__(self, refresh_seconds: float = 0):
+        self.refresh_seconds = refresh_seconds
+        self._generation = 0
+        self._snapshot: Optional[RuleSnapshot] = None
+        self._checked_at = 0.0
+        # Compiled rules keyed on (id, version, updated_at) so unchanged rules
+        # are not recompiled when the snapshot is rebuilt.
+        self._compiled: Dict[Tuple, CompiledRule] = {}
+        self._listeners = []
+        # The load in flight, which requests of the same generation share
+        self._loading: Optional[asyncio.Future] = None
+        self._loading_generation: Optional[int] = None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def snapshot(self) -> Optional[RuleSnapshot]:
+        return self._snapshot
+
+    def bump(self) -> int:
+        """Marks the current snapshot stale. Called after every rule write."""
+        self._generation += 1
+        for listener in self._listeners:
+            listener(self._generation)
+        return self._generation
+
+    def subscribe(self, listener):
+        """Registers `listener(generation)` to be called whenever the rule set changes."""
+        self._listeners.append(listener)
+
+    async def get(self, db: AsyncSession) -> RuleSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.generation == self._generation:
+            if not self.refresh_seconds or time.monotonic() - self._checked_at < self.refresh_seconds:
+                return snapshot
+            self._checked_at = time.monotonic()
+            if await self._fingerprint(db) == snapshot.fingerprint:
+                return snapshot
+            # Changed elsewhere: requests meanwhile keep this snapshot
+            refreshed = await self.refresh(db)
+            if refreshed is not None:
+                return refreshed
+        # Stale after a write in this worker: it must see its own write, so
+        # wait for a load of the current generation (at most one at a time)
+        if self._loading is not None and self._loading_generation == self._generation:
+            return await asyncio.shield(self._loading)
+        return await self.load(db)
+
+    async def load(self, db: AsyncSession) -> RuleSnapshot:
+        generation = self._generation
+        loading = self._loading = asyncio.get_running_loop().create_future()
+        self._loading_generation = generation
+        try:
+            snapshot = await self._build(db, generation)
+        except asyncio.CancelledError:
+            loading.cancel()
+            raise
+        except Exception as exc:
+            loading.set_exception(exc)
+            # Nobody may be waiting for it; don't log "exception never retrieved"
+            loading.exception()
+            raise
+        else:
+            loading.set_result(snapshot)
+        finally:
+            if self._loading is loading:
+                self._loading = None
+        # Only publish if no write happened while we were loading.
+        if generation == self._generation:
+            self._snapshot = snapshot
+        return snapshot
+
+    async def refresh(self, db: AsyncSession) -> Optional[RuleSnapshot]:
+        """
+        For changes made elsewhere: builds the next generation's snapshot first,
+        then publishes it and bumps together, so requests keep the current
+        snapshot meanwhile. None if a local write bumped in between; requests
+        then load the write's generation themselves.
+        """
+        generation = self._generation
+        snapshot = await self._build(db, generation + 1)
+        if generation != self._generation:
+            return None
+        self._snapshot = snapshot
+        self.bump()
+        return snapshot
+
+    async def _build(self, db: AsyncSession, generation: int) -> RuleSnapshot:
+        result = await db.execute(select(Rule).where(Rule.is_active == True).order_by(Rule.id))
+        rules = result.scalars().all()
+
+        compiled = {}
+        for rule in rules:
+            key = (rule.id, rule.version or 1, rule.updated_at)
+            compiled[key] = self._compiled.get(key) or compile_rule(rule)
+
+        snapshot = build_snapshot(generation, await self._fingerprint(db), compiled.values())
+        self._compiled = compiled
+        self._checked_at = time.monotonic()
+        return snapshot
+
+    async def _fingerprint(self, db: AsyncSession) -> Tuple:
+        result = await db.execute(
+            select(
+                func.count(Rule.id),
+                func.sum(Rule.version),
+                func.max(Rule.updated_at),
+            ).where(Rule.is_active == True)
+        )
+        count, version_sum, last_updated = result.one()
+        return (count or 0, version_sum or 0, str(last_updated) if last_updated else None)
+
+
+rule_registry = RuleSetRegistry(refresh_seconds=settings.RULE_SET_REFRESH_SECONDS)
+rule_registry.subscribe(decision_cache.clear)
+
+# "full-audit" reports every triggered rule; "first-block" stops at the first
+# BLOCK hit and skips WARN rules on the decline path.
+EVALUATION_MODES = ("full-audit", "first-block")
+
+
+def summarize(triggered: List[CompiledRule], timed_out_count: int = 0) -> str:
+    reason_summary = "No rules triggered."
+    if triggered:
+        reason_summary = f"Triggered {len(triggered)} rules: " + ", ".join([r.name for r in triggered])
+    if timed_out_count:
+        reason_summary += f" ({timed_out_count} rules exceeded their time budget)"
+    return reason_summary
+
+
+def match_prompt(snapshot: RuleSnapshot, text: str, mode: str) -> dict:
+    """Runs the compiled rules over `text`. Pure CPU work, safe to run off the event loop."""
+    decision = "ACCEPT"
+
+    timed_out = set()
+    block_ms, warn_ms = {}, {}
+    if mode == "first-block":
+        blocking = snapshot.block_matcher.first(text, timed_out, block_ms)
+        hits = {blocking} if blocking is not None else snapshot.warn_matcher.scan(text, timed_out, warn_ms)
+    else:
+        blocking = None
+        hits = snapshot.block_matcher.scan(text, timed_out, block_ms) | snapshot.warn_matcher.scan(text, timed_out, warn_ms)
+
+    triggered = [rule for rule in snapshot.rules if rule.id in hits]
+    if blocking is not None or any(rule.severity == "BLOCK" for rule in triggered):
+        decision = "DECLINE"
+
+    return {
+        "decision": decision,
+        "reason_summary": summarize(triggered, len(timed_out)),
+        "triggered_rules": [r.id for r in triggered],
+        "timed_out_rules": sorted(timed_out),
+        # Milliseconds per matching stage, e.g. "block:regex" or "warn:rule:12"
+        "stages_ms": {
+            **{f"block:{label}": ms for label, ms in block_ms.items()},
+            **{f"warn:{label}": ms for label, ms in warn_ms.items()},
+        },
+    }
+
+
+# Snapshots rebuilt inside process-pool workers, keyed on (generation, fingerprint)
+_worker_snapshots: Dict[Tuple, RuleSnapshot] = {}
+
+
+def _match_in_worker(key: Tuple, text: str, mode: str, rules: Optional[Tuple[CompiledRule, ...]] = None) -> Optional[dict]:
+    """
+    Matches in a process-pool worker against its cached snapshot for `key`.
+    Returns None if the worker has none yet and no `rules` were sent: the rules
+    are pickled only for the first call per worker and rule-set generation.
+    """
+    snapshot = _worker_snapshots.get(key)
+    if snapshot is None:
+        if rules is None:
+            return None
+        _worker_snapshots.clear()
+        snapshot = _worker_snapshots[key] = build_snapshot(key[0], key[1], rules)
+    return match_prompt(snapshot, text, mode)
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
 
 class RuleEngine:
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        registry: RuleSetRegistry = rule_registry,
+        mode: Optional[str] = None,
+        executor: RuleExecutor = rule_executor,
+        cache: Optional[DecisionCache] = decision_cache,
+        classifier: Optional[LLMClassifier] = llm_classifier,
+    ):
         self.db = db
+        self.registry = registry
+        self.executor = executor
+        self.cache = cache
+        self.classifier = classifier
+        self.mode = mode or settings.RULE_EVALUATION_MODE
+        if self.mode not in EVALUATION_MODES:
+            raise ValueError(f"Unknown rule evaluation mode: {self.mode}")
 
     async def evaluate(self, request: PromptRequest) -> dict:
         """
         Evaluates a prompt against active rules.
         Returns evaluation result dict.
+        Raises ExecutorBusy if the prompt needs offloading and the worker pool is saturated.
         """
-        # Fetch active rules
-        result = await self.db.execute(select(Rule).where(Rule.is_active == True))
-        rules = result.scalars().all()
-        
-        triggered = []
-        decision = "ACCEPT"
-        reason_summary = "No rules triggered."
-        
-        for rule in rules:
-            if rule.type == "REGEX":
-                payload = rule.payload_json
-                pattern = payload.get("pattern")
-                if pattern and re.search(pattern, request.prompt_text, re.IGNORECASE):
-                    triggered.append(rule)
-                    if rule.severity == "BLOCK":
-                        decision = "DECLINE"
-        
-        if triggered:
-            # Prioritize BLOCK decision
-            if any(r.severity == "BLOCK" for r in triggered):
-                decision = "DECLINE"
-            
-            reason_summary = f"Triggered {len(triggered)} rules: " + ", ".join([r.name for r in triggered])
-
-        return {
-            "decision": decision,
-            "reason_summary": reason_summary,
-            "triggered_rules": [r.id for r in triggered]
+        start = time.perf_counter()
+        snapshot = await self.registry.get(self.db)
+        result = await self._evaluate(snapshot, request, _elapsed_ms(start))
+        return await self._classify(snapshot, request, result)
+
+    async def evaluate_many(self, requests: List[PromptRequest]) -> List[dict]:
+        """
+        Evaluates several prompts against one rule snapshot, preserving order.
+        Classifier calls for the batch run concurrently (within its concurrency cap).
+        """
+        start = time.perf_counter()
+        snapshot = await self.registry.get(self.db)
+        snapshot_ms = _elapsed_ms(start)
+        results = [await self._evaluate(snapshot, request, snapshot_ms) for request in requests]
+        return list(await asyncio.gather(*(
+            self._classify(snapshot, request, result) for request, result in zip(requests, results)
+        )))
+
+    async def _evaluate(self, snapshot: RuleSnapshot, request: PromptRequest, snapshot_ms: float = 0.0) -> dict:
+        """
+        The result carries a `trace` dict with per-stage timings in milliseconds,
+        meant for PromptEvaluation.trace_json.
+        """
+        start = time.perf_counter()
+        text = request.prompt_text
+        trace = {
+            "mode": self.mode,
+            "rule_set_generation": snapshot.generation,
+            "cached": False,
+            "offloaded": False,
+            "timings_ms": {"rule_snapshot": snapshot_ms},
+        }
+
+        key = None
+        if self.cache is not None and self.cache.enabled:
+            # The fingerprint (not the per-process generation) keys the entry, so
+            # entries are valid across workers sharing the cache backend.
+            key = cache_key(snapshot.fingerprint, self.mode, text, request.intended_use, request.context)
+            cached = await self.cache.get(key)
+            trace["timings_ms"]["cache_lookup"] = _elapsed_ms(start)
+            if cached is not None:
+                trace["cached"] = True
+                trace["timings_ms"]["total"] = snapshot_ms + _elapsed_ms(start)
+                return {**cached, "trace": trace}
+
+        size = len(text) + len(request.context or "")
+        trace["offloaded"] = self.executor.should_offload(size)
+        match_start = time.perf_counter()
+        if self.executor.mode == "process" and trace["offloaded"]:
+            snapshot_key = (snapshot.generation, snapshot.fingerprint)
+            result = await self.executor.run(size, _match_in_worker, snapshot_key, text, self.mode)
+            if result is None:
+                result = await self.executor.run(size, _match_in_worker, snapshot_key, text, self.mode, snapshot.rules)
+        else:
+            result = await self.executor.run(size, match_prompt, snapshot, text, self.mode)
+        trace["timings_ms"]["match"] = _elapsed_ms(match_start)
+
+        stages_ms = result.pop("stages_ms")
+        for stage, ms in stages_ms.items():
+            RULE_MATCH_SECONDS.observe(ms / 1000, stage=stage)
+        trace["stages_ms"] = stages_ms
+
+        # Time-outs depend on load, so those results are not worth repeating
+        if key is not None and not result["timed_out_rules"]:
+            await self.cache.set(key, result)
+        trace["timings_ms"]["total"] = snapshot_ms + _elapsed_ms(start)
+        return {**result, "trace": trace}
+
+    async def _classify(self, snapshot: RuleSnapshot, request: PromptRequest, result: dict) -> dict:
+        """
+        Runs the LLM classifier stage when there are active LLM rules and the
+        deterministic rules did not already decline. Adds an `llm` dict (model,
+        status, latency_ms, labels) to the result. A failed call leaves the
+        rule-only decision in place.
+        """
+        if self.classifier is None or not snapshot.llm_rules:
+            return result
+        if result["decision"] == "DECLINE":
+            return {**result, "llm": {"model": self.classifier.model, "status": SKIPPED, "latency_ms": None, "labels": []}}
+
+        start = time.perf_counter()
+        labels = {rule.payload["label"]: rule.payload.get("description") or rule.name for rule in snapshot.llm_rules}
+        outcome = await self.classifier.classify(request.prompt_text, labels)
+        result = {
+            **result,
+            "llm": {
+                "model": outcome.model,
+                "status": outcome.status,
+                "latency_ms": outcome.latency_ms,
+                "labels": outcome.labels,
+                "cached": outcome.cached,
+            },
         }
+        result["trace"]["timings_ms"]["llm"] = _elapsed_ms(start)
+        result["trace"]["timings_ms"]["total"] += result["trace"]["timings_ms"]["llm"]
 
-    async def mock_llm_check(self, prompt_text: str):
-        # TODO: Integrate OpenAI Check
-        pass
+        llm_hits = [rule for rule in snapshot.llm_rules if rule.payload["label"] in outcome.labels]
+        if not llm_hits:
+            return result
+        triggered_ids = set(result["triggered_rules"]) | {rule.id for rule in llm_hits}
+        triggered = [rule for rule in snapshot.rules if rule.id in triggered_ids]
+        result["triggered_rules"] = [rule.id for rule in triggered]
+        result["reason_summary"] = summarize(triggered, len(result["timed_out_rules"]))
+        if any(rule.severity == "BLOCK" for rule in llm_hits):
+            result["decision"] = "DECLINE"
+        return result
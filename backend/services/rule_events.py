@@ -0,0 +1,144 @@
+"""
+Rule change propagation across workers and replicas.
+
+The rules API publishes an event in the same transaction as every rule write.
+On PostgreSQL that is a NOTIFY on RULE_CHANGE_CHANNEL, delivered on commit;
+elsewhere (SQLite in development and tests) an in-process bus stands in.
+
+Each worker runs a RuleChangeListener (started in the app lifespan). On an
+event from another worker it bumps the local rule registry and rebuilds the
+compiled rule set in the background, so requests keep using the previous
+snapshot until the new one is ready. Bursts of events coalesce into a single
+rebuild. If the LISTEN connection drops, the registry's periodic fingerprint
+check (RULE_SET_REFRESH_SECONDS) still catches changes while it reconnects.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from db.session import AsyncSessionLocal
+from services.rule_engine import rule_registry
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in events, so a worker skips its own (it has already bumped)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_local_subscribers: List[Callable[[str], None]] = []
+
+
+async def publish(db: AsyncSession, rule_id: Optional[int], origin: str = WORKER_ID):
+    """Announces a rule write. Call before committing it."""
+    payload = json.dumps({"origin": origin, "rule_id": rule_id})
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": settings.RULE_CHANGE_CHANNEL, "payload": payload})
+        return
+    for subscriber in list(_local_subscribers):
+        subscriber(payload)
+
+
+class RuleChangeListener:
+    def __init__(self, registry, database_url: str = settings.DATABASE_URL, session_factory=AsyncSessionLocal,
+                 origin: str = WORKER_ID, reconnect_seconds: float = 5.0):
+        self.registry = registry
+        self.url = make_url(database_url)
+        self.session_factory = session_factory
+        self.origin = origin
+        self.reconnect_seconds = reconnect_seconds
+        self.mode = "stopped"
+        self.received = 0
+        self.rebuilds = 0
+        self._changed = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._connection = None
+
+    async def start(self):
+        if self._tasks:
+            return
+        if self.url.get_backend_name() == "postgresql":
+            self.mode = "postgres"
+            self._tasks.append(asyncio.create_task(self._listen(), name="rule-change-listen"))
+        else:
+            self.mode = "local"
+            _local_subscribers.append(self._on_payload)
+        self._tasks.append(asyncio.create_task(self._rebuild_loop(), name="rule-change-rebuild"))
+
+    async def stop(self):
+        if self._on_payload in _local_subscribers:
+            _local_subscribers.remove(self._on_payload)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._close_connection()
+        self.mode = "stopped"
+
+    def _on_payload(self, payload: str):
+        try:
+            origin = json.loads(payload).get("origin")
+        except (ValueError, AttributeError):
+            origin = None
+        if origin == self.origin:
+            return
+        self.received += 1
+        self._changed.set()
+
+    async def _listen(self):
+        import asyncpg
+
+        dsn = self.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        channel = settings.RULE_CHANGE_CHANNEL
+        while True:
+            try:
+                self._connection = await asyncpg.connect(dsn)
+                await self._connection.add_listener(channel, lambda _conn, _pid, _channel, payload: self._on_payload(payload))
+                # Anything may have changed while we were not listening
+                self._changed.set()
+                while not self._connection.is_closed():
+                    await asyncio.sleep(self.reconnect_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Rule change listener disconnected: %s", exc)
+            await self._close_connection()
+            await asyncio.sleep(self.reconnect_seconds)
+
+    async def _close_connection(self):
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    async def _rebuild_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                # Built before the bump, so requests keep the current snapshot meanwhile
+                async with self.session_factory() as db:
+                    await self.registry.refresh(db)
+                self.rebuilds += 1
+            except Exception:
+                # Requests still notice the change through the fingerprint check
+                logger.exception("Background rule set rebuild failed")
+
+    def status(self) -> dict:
+        snapshot = self.registry.snapshot
+        return {
+            "generation": self.registry.generation,
+            # Lags `generation` while a rebuild is in progress
+            "snapshot_generation": snapshot.generation if snapshot is not None else None,
+            "fingerprint": list(snapshot.fingerprint) if snapshot is not None else None,
+            "listener": self.mode,
+        }
+
+
+rule_listener = RuleChangeListener(rule_registry)
@@ -0,0 +1,122 @@
+"""
+Admin search over audit history.
+
+A query matches prompts whose text or context contains it (through the
+full-text index in models.search) or whose reason_summary contains it as a
+substring (a trigram index serves this on PostgreSQL). Results can be narrowed
+by decision, user, triggered rule and a [since, until) time range, and are
+paged newest first with the same cursors as history.
+
+Query syntax follows PostgreSQL's websearch_to_tsquery: words must all occur,
+"quoted phrases" must occur as written. SQLite FTS5 gets the same meaning.
+"""
+import re
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
+
+from sqlalchemy import cast, column, exists, func, literal, literal_column, select, table, tuple_, union
+from sqlalchemy.dialects.postgresql import JSONB, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.prompt import PromptBlob, PromptEvaluation, PromptRequest
+from models.search import SEARCH_TABLE
+from services.history import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+
+Decision = Literal["ACCEPT", "DECLINE"]
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def search_terms(query: str) -> List[str]:
+    """The words and quoted phrases of a search query; empty for a blank or quotes-only query."""
+    return [phrase for quoted, word in _TERM.findall(query) if (phrase := quoted or word).strip()]
+
+
+def fts5_query(query: str) -> str:
+    """Rewrites a search query as an FTS5 expression of quoted (AND-ed) phrases."""
+    return " ".join('"' + phrase.replace('"', '""') + '"' for phrase in search_terms(query))
+
+
+def _matching_hashes(dialect: str, query: str):
+    index = table(SEARCH_TABLE, column("hash"), column("document"))
+    if dialect == "postgresql":
+        tsquery = func.websearch_to_tsquery(cast(literal(settings.SEARCH_TEXT_CONFIG), REGCONFIG), query)
+        return select(index.c.hash).where(index.c.document.op("@@")(tsquery))
+    return select(index.c.hash).where(literal_column(SEARCH_TABLE).op("MATCH")(fts5_query(query)))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _triggered(dialect: str, rule_id: int):
+    rules = PromptEvaluation.triggered_rules_json
+    if dialect == "postgresql":
+        condition = cast(rules, JSONB).contains([rule_id])
+    else:
+        entries = func.json_each(rules).table_valued("value")
+        condition = exists(select(1).select_from(entries).where(entries.c.value == rule_id))
+    return exists(select(1).where(PromptEvaluation.request_id == PromptRequest.id, condition))
+
+
+async def search_page(
+    db: AsyncSession,
+    query: str,
+    decision: Optional[Decision] = None,
+    user_id: Optional[int] = None,
+    rule_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Tuple[List, Optional[str]]:
+    """
+    Returns (rows, next_cursor) like services.history.history_page, with rows
+    in the "summary" projection. Raises InvalidCursor for a bad cursor. A query
+    without search terms matches nothing.
+    """
+    if not search_terms(query):
+        return [], None
+    dialect = db.get_bind().dialect.name
+    hashes = _matching_hashes(dialect, query)
+    # Each branch can use its own index; the union is usually small
+    matches = union(
+        select(PromptRequest.id).where(PromptRequest.prompt_hash.in_(hashes)),
+        select(PromptRequest.id).where(PromptRequest.context_hash.in_(hashes)),
+        select(PromptRequest.id).where(PromptRequest.reason_summary.ilike(f"%{_escape_like(query)}%", escape="\\")),
+    )
+
+    stmt = (
+        select(
+            PromptRequest.id,
+            PromptRequest.user_id,
+            PromptRequest.intended_use,
+            PromptRequest.decision,
+            PromptRequest.reason_summary,
+            PromptRequest.created_at,
+            PromptBlob.preview.label("prompt_preview"),
+        )
+        .join(PromptBlob, PromptBlob.hash == PromptRequest.prompt_hash)
+        .where(PromptRequest.id.in_(matches))
+    )
+    if decision is not None:
+        stmt = stmt.where(PromptRequest.decision == decision)
+    if user_id is not None:
+        stmt = stmt.where(PromptRequest.user_id == user_id)
+    if rule_id is not None:
+        stmt = stmt.where(_triggered(dialect, rule_id))
+    if since is not None:
+        stmt = stmt.where(PromptRequest.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(PromptRequest.created_at < until)
+    if cursor:
+        created_at, request_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(PromptRequest.created_at, PromptRequest.id) < tuple_(created_at, request_id))
+    stmt = stmt.order_by(PromptRequest.created_at.desc(), PromptRequest.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,253 @@
+"""
+Embedding-based matching for SEMANTIC rules.
+
+A SEMANTIC rule lists example phrases ({"examples": [...], "threshold": 0.8}).
+The examples of all rules in a matcher are embedded once, when the rule
+snapshot is built, into one L2-normalized float32 matrix. A prompt is then
+embedded once and scored against every example with a single matrix-vector
+product; a rule triggers when its best example reaches the rule's threshold.
+
+With many examples an inverted-file (IVF) index takes over: examples are
+clustered with k-means and only the clusters closest to the prompt are scored.
+
+Embedders run locally on CPU, in batches:
+
+* "hashing" (default): signed feature hashing of words and character
+  trigrams. Dependency-free beyond NumPy and deterministic, but lexical, not
+  semantic: it catches reordered and lightly reworded phrases (shared words and
+  spellings), not paraphrases with different words.
+* "sentence-transformers": a real sentence embedding model. Needs the optional
+  packages in requirements-semantic.txt; without them the hashing embedder is
+  used and a warning logged.
+
+Example vectors are cached across snapshot rebuilds; prompts are embedded
+without the cache, so they neither evict example vectors nor stay in memory.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config import settings
+
+try:  # Optional local sentence embedding models
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - depends on environment
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDERS = ("hashing", "sentence-transformers")
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 512, batch_size: int = 64):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+        self.batch_size = batch_size
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                index, sign = _bucket(feature, self.dim)
+                vectors[row, index] += sign
+        return _normalize(vectors)
+
+
+@lru_cache(maxsize=200000)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str, batch_size: int = 64):
+        if SentenceTransformer is None:
+            raise RuntimeError("The sentence-transformers package is required for this embedder")
+        self.name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingCache:
+    """
+    Wraps an embedder with an LRU of phrase vectors (so unchanged rules are not
+    re-embedded when a snapshot is rebuilt) and batches the misses.
+    """
+
+    def __init__(self, embedder, max_entries: int = 10000):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.embedder.name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for text in texts:
+                vector = self._vectors.get(text)
+                if vector is not None:
+                    found[text] = vector
+                    self._vectors.move_to_end(text)
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        batch_size = getattr(self.embedder, "batch_size", 64)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = self.embedder.embed(batch)
+            found.update(zip(batch, vectors))
+            with self._lock:
+                for text, vector in zip(batch, vectors):
+                    self._vectors[text] = vector
+                while len(self._vectors) > self.max_entries:
+                    self._vectors.popitem(last=False)
+        return np.stack([found[text] for text in texts])
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized vectors: k-means clusters, searched by
+    scoring only the members of the `probes` clusters nearest the query.
+    """
+
+    def __init__(self, vectors: np.ndarray, lists: Optional[int] = None, probes: int = 8, iterations: int = 10, seed: int = 0):
+        count = len(vectors)
+        lists = lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(count, size=min(lists, count), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for index in range(len(centroids)):
+                members = vectors[assignment == index]
+                if len(members):
+                    centroids[index] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.members = [np.flatnonzero(assignment == index) for index in range(len(centroids))]
+        self.probes = min(probes, len(centroids))
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        nearest = np.argpartition(-(self.centroids @ query), self.probes - 1)[:self.probes]
+        return np.concatenate([self.members[index] for index in nearest])
+
+
+class SemanticMatcher:
+    """Matching stage for SEMANTIC rules, with the same scan/first interface as the other stages."""
+
+    def __init__(
+        self,
+        rules: Iterable,
+        embedder=None,
+        threshold: float = 0.6,
+        ann_min_rows: int = 5000,
+        ann_probes: int = 8,
+    ):
+        self.label = "semantic"
+        rows: List[Tuple[int, str, float]] = []
+        for rule in rules:
+            rule_threshold = float(rule.payload.get("threshold", threshold))
+            for example in example_list(rule.payload):
+                rows.append((rule.id, example, rule_threshold))
+        self.rule_count = len({rule_id for rule_id, _, _ in rows})
+        self.embedder = embedder
+        self.index: Optional[IVFIndex] = None
+        if not rows:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            return
+
+        self.embedder = embedder or get_embedder()
+        # Prompts bypass the EmbeddingCache: it is there for the examples
+        self._query_embedder = getattr(self.embedder, "embedder", self.embedder)
+        self.matrix = np.ascontiguousarray(self.embedder.embed([example for _, example, _ in rows]), dtype=np.float32)
+        self.row_rules = np.array([rule_id for rule_id, _, _ in rows])
+        self.row_thresholds = np.array([value for _, _, value in rows], dtype=np.float32)
+        if len(rows) >= ann_min_rows:
+            self.index = IVFIndex(self.matrix, probes=ann_probes)
+
+    def scores(self, text: str) -> Dict[int, float]:
+        """Best similarity per rule among the examples that reach their threshold."""
+        if not self.rule_count:
+            return {}
+        query = self._query_embedder.embed([text])[0]
+        if self.index is not None:
+            rows = self.index.candidates(query)
+            similarities = self.matrix[rows] @ query
+        else:
+            rows = None
+            similarities = self.matrix @ query
+        thresholds = self.row_thresholds if rows is None else self.row_thresholds[rows]
+        rule_ids = self.row_rules if rows is None else self.row_rules[rows]
+        best: Dict[int, float] = {}
+        for position in np.flatnonzero(similarities >= thresholds):
+            rule_id = int(rule_ids[position])
+            best[rule_id] = max(best.get(rule_id, -1.0), float(similarities[position]))
+        return best
+
+    def scan(self, text: str, timed_out: Optional[Set[int]] = None) -> Set[int]:
+        return set(self.scores(text))
+
+    def first(self, text: str, timed_out: Optional[Set[int]] = None) -> Optional[int]:
+        best = self.scores(text)
+        return max(best, key=best.get) if best else None
+
+
+def example_list(payload: dict) -> List[str]:
+    examples = payload.get("examples") or []
+    if isinstance(examples, str):
+        examples = [examples]
+    return [example for example in examples if isinstance(example, str) and example.strip()]
+
+
+def build_embedder(name: str):
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown semantic embedder: {name}")
+    if name == "sentence-transformers":
+        if SentenceTransformer is not None:
+            return SentenceTransformerEmbedder(settings.SEMANTIC_MODEL, settings.SEMANTIC_BATCH_SIZE)
+        logger.warning("sentence-transformers is not installed; using the hashing embedder")
+    return HashingEmbedder(batch_size=settings.SEMANTIC_BATCH_SIZE)
+
+
+_embedder: Optional[EmbeddingCache] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> EmbeddingCache:
+    """The process-wide embedder, created on first use (models can be slow to load)."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = EmbeddingCache(build_embedder(settings.SEMANTIC_EMBEDDER))
+        return _embedder
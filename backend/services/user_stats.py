@@ -0,0 +1,138 @@
+"""
+Incrementally maintained decision counters behind GET /admin/users/stats.
+
+`record_decisions` runs in the same transaction as the audit rows it counts,
+so counters never drift from history on commit/rollback. It inserts the audit
+rows first and then upserts one row per user (and day) in key order, so
+concurrent flushes take the counter row locks in the same order and cannot
+deadlock on each other.
+
+`rollup_days` recomputes a range of days from promptrequest: the retention
+job calls it before old partitions are dropped, and `rebuild` after manual
+edits.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.prompt import PromptRequest
+from models.stats import UserDailyStats, UserStats
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _counts(rows) -> dict:
+    return {
+        "total": len(rows),
+        "accepted_count": sum(1 for r in rows if r.decision == "ACCEPT"),
+        "declined_count": sum(1 for r in rows if r.decision == "DECLINE"),
+    }
+
+
+async def record_decisions(session: AsyncSession, prompt_requests: Iterable[PromptRequest]):
+    """
+    Flushes `prompt_requests` and adds their decisions to the counter tables
+    (without committing).
+    """
+    prompt_requests = list(prompt_requests)
+    today = datetime.now(timezone.utc).date()
+    by_user, by_day = defaultdict(list), defaultdict(list)
+    for request in prompt_requests:
+        day = request.created_at.astimezone(timezone.utc).date() if request.created_at else today
+        by_user[request.user_id].append(request)
+        by_day[(request.user_id, day)].append(request)
+
+    await session.flush()
+    for user_id, rows in sorted(by_user.items(), key=lambda item: item[0]):
+        await _increment(session, UserStats, {"user_id": user_id}, ["user_id"], _counts(rows))
+    for (user_id, day), rows in sorted(by_day.items(), key=lambda item: item[0]):
+        await _increment(session, UserDailyStats, {"user_id": user_id, "day": day}, ["user_id", "day"], _counts(rows))
+
+
+async def _increment(session: AsyncSession, model, key: dict, key_columns, counts: dict):
+    dialect = session.get_bind().dialect.name
+    upsert = _UPSERT_DIALECTS.get(dialect)
+    if upsert is not None:
+        stmt = upsert(model).values(**key, **counts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in counts},
+        )
+        await session.execute(stmt)
+        return
+
+    # Generic fallback: update, then insert if nothing was there yet
+    conditions = [getattr(model, name) == value for name, value in key.items()]
+    result = await session.execute(
+        update(model).where(*conditions).values({name: getattr(model, name) + value for name, value in counts.items()})
+    )
+    if result.rowcount == 0:
+        await session.execute(insert(model).values(**key, **counts))
+
+
+def _day_expression(dialect: str):
+    if dialect == "postgresql":
+        return func.date(func.timezone("UTC", PromptRequest.created_at))
+    return func.date(PromptRequest.created_at)
+
+
+def _utc_midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+async def rollup_days(session: AsyncSession, start: Optional[date] = None, end: Optional[date] = None):
+    """
+    Recomputes the daily counters for days in [start, end) from promptrequest,
+    then the per-user totals from the daily counters (without committing).
+    Days outside the range are kept as they are.
+    """
+    dialect = session.get_bind().dialect.name
+    accepted = func.sum(case((PromptRequest.decision == "ACCEPT", 1), else_=0))
+    declined = func.sum(case((PromptRequest.decision == "DECLINE", 1), else_=0))
+    day = _day_expression(dialect)
+
+    stale = delete(UserDailyStats)
+    history = select(PromptRequest.user_id, day, func.count(PromptRequest.id), accepted, declined)
+    if start is not None:
+        stale = stale.where(UserDailyStats.day >= start)
+        history = history.where(PromptRequest.created_at >= _utc_midnight(start))
+    if end is not None:
+        stale = stale.where(UserDailyStats.day < end)
+        history = history.where(PromptRequest.created_at < _utc_midnight(end))
+
+    await session.execute(stale)
+    await session.execute(
+        insert(UserDailyStats).from_select(
+            ["user_id", "day", "total", "accepted_count", "declined_count"],
+            history.group_by(PromptRequest.user_id, day),
+        )
+    )
+    await session.execute(delete(UserStats))
+    await session.execute(
+        insert(UserStats).from_select(
+            ["user_id", "total", "accepted_count", "declined_count"],
+            select(
+                UserDailyStats.user_id,
+                func.sum(UserDailyStats.total),
+                func.sum(UserDailyStats.accepted_count),
+                func.sum(UserDailyStats.declined_count),
+            ).group_by(UserDailyStats.user_id),
+        )
+    )
+
+
+async def rebuild(session: AsyncSession):
+    """
+    Recomputes the counters from the history still in promptrequest, in one
+    transaction. Days before the oldest remaining row were rolled up by the
+    retention job and are kept.
+    """
+    oldest = await session.scalar(select(func.min(PromptRequest.created_at)))
+    if oldest is not None:
+        oldest = (oldest.astimezone(timezone.utc) if oldest.tzinfo else oldest).date()
+    await rollup_days(session, start=oldest)
+    await session.commit()
@@ -0,0 +1,110 @@
+"""
+Worker warm-up, so the first requests after a (scale-out) start are not slow.
+
+Started in the app lifespan as a background task, so the worker answers
+/health immediately; /ready answers 503 until every step has finished. The
+steps load what the request path otherwise loads on first use:
+
+* security: the password hashing and token libraries,
+* rules: a DB connection and the compiled active rule set,
+* matchers: one scan through the compiled matchers, which loads the regex
+  engines and, for SEMANTIC rules, the embedding model,
+* executor: the rule executor's thread or process pool.
+
+A failed step (e.g. the database not accepting connections yet) is retried
+every WARMUP_RETRY_SECONDS; steps that succeeded are not repeated.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from core import security
+from core.config import settings
+from core.metrics import STARTUP_SECONDS
+from db.session import AsyncSessionLocal
+from services.executor import rule_executor
+from services.rule_engine import rule_registry
+
+logger = logging.getLogger(__name__)
+
+
+async def _load_rules():
+    async with AsyncSessionLocal() as db:
+        await rule_registry.get(db)
+
+
+async def _scan_once():
+    snapshot = rule_registry.snapshot
+    if snapshot is not None:
+        for matcher in (snapshot.block_matcher, snapshot.warn_matcher):
+            await asyncio.to_thread(matcher.scan, "warm-up")
+
+
+STEPS = (
+    ("security", lambda: asyncio.to_thread(security.warm_up)),
+    ("rules", _load_rules),
+    ("matchers", _scan_once),
+    ("executor", rule_executor.warm_up),
+)
+
+
+class WarmUp:
+    def __init__(self, retry_seconds: float = 5.0):
+        self.retry_seconds = retry_seconds
+        # Seconds per finished step
+        self.steps: Dict[str, float] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def start(self):
+        if self._task is None:
+            self.started_at = time.perf_counter()
+            self._task = asyncio.create_task(self._run(), name="warm-up")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def _run(self):
+        for name, step in STEPS:
+            while name not in self.steps:
+                start = time.perf_counter()
+                try:
+                    await step()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    self.error = f"{name}: {exc}"
+                    logger.warning("Warm-up step %s failed, retrying in %ss: %s", name, self.retry_seconds, exc)
+                    await asyncio.sleep(self.retry_seconds)
+                    continue
+                self.steps[name] = round(time.perf_counter() - start, 4)
+        self.error = None
+        self.finished_at = time.perf_counter()
+        STARTUP_SECONDS.set(self.finished_at - self.started_at, phase="warmup")
+        logger.info("Warm-up finished in %.3fs", self.finished_at - self.started_at)
+
+    def status(self) -> dict:
+        end = self.finished_at if self.ready else time.perf_counter()
+        return {
+            "ready": self.ready,
+            "seconds": round(end - self.started_at, 4) if self.started_at is not None else None,
+            "steps": dict(self.steps),
+            "error": self.error,
+        }
+
+
+warm_up = WarmUp(retry_seconds=settings.WARMUP_RETRY_SECONDS)
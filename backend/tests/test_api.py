@@ -1,6 +1,7 @@
 import sys
 import os
 sys.path.append(os.getcwd()) # Ensure root is in path
+import asyncio
 import pytest
 from httpx import AsyncClient, ASGITransport
 from main import app
@@ -8,6 +9,8 @@ from db.session import get_db, engine
 from models.base import Base
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
+from jose import jwt
+from sqlalchemy import select
 
 # Override DB for testing (or use the one in docker if compatible)
 # For simplicity in this env, we'll hit the running app or use AsyncClient with the app directly
@@ -62,3 +65,257 @@ async def test_prompt_evaluation():
         response = await ac.get("/api/v1/prompts/history", headers=headers)
         assert response.status_code == 200
         assert len(response.json()) > 0
+
+@pytest.mark.asyncio
+async def test_batch_evaluation():
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        prompts = [f"Summarize quarterly report {i}" for i in range(3)]
+        response = await ac.post("/api/v1/prompts/evaluate/batch", json={
+            "items": [{"prompt_text": p, "intended_use": "Reporting"} for p in prompts]
+        }, headers=headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["prompt_text"] for item in data] == prompts
+        assert all(item["id"] and item["decision"] in ["ACCEPT", "DECLINE"] for item in data)
+
+        response = await ac.post("/api/v1/prompts/evaluate/batch", json={
+            "items": [{"prompt_text": "x", "intended_use": "Reporting"}] * 1000
+        }, headers=headers)
+        assert response.status_code == 413
+
+@pytest.mark.asyncio
+async def test_cached_principal_is_dropped_on_deactivation():
+    from db.session import AsyncSessionLocal
+    from models.user import User
+    from services.principal_cache import principal_cache
+
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = int(jwt.get_unverified_claims(token)["sub"])
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        assert (await ac.get("/api/v1/prompts/history", headers=headers)).status_code == 200
+        assert principal_cache.get(user_id) is not None
+
+        # What PATCH /admin/users/{id} does, without needing an admin account
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
+            user.is_active = False
+            await db.commit()
+            principal_cache.invalidate(user_id)
+            try:
+                assert (await ac.get("/api/v1/prompts/history", headers=headers)).status_code == 403
+            finally:
+                user.is_active = True
+                await db.commit()
+                principal_cache.invalidate(user_id)
+
+@pytest.mark.asyncio
+async def test_evaluation_trace_and_metrics():
+    from db.session import AsyncSessionLocal
+    from models.prompt import PromptEvaluation
+
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/v1/prompts/evaluate", json={
+            "prompt_text": "Draft a product announcement.",
+            "intended_use": "Marketing"
+        }, headers=headers)
+        assert response.status_code == 200
+
+        async with AsyncSessionLocal() as db:
+            evaluation = (await db.execute(
+                select(PromptEvaluation).where(PromptEvaluation.request_id == response.json()["id"])
+            )).scalars().first()
+            assert evaluation.triggered_rules_json is not None
+            assert "total" in evaluation.trace_json["timings_ms"]
+
+        response = await ac.get("/metrics")
+        assert response.status_code == 200
+        assert 'spotixx_http_request_seconds_count{method="POST",route="/api/v1/prompts/evaluate"' in response.text
+        assert "spotixx_db_seconds_bucket" in response.text
+
+@pytest.mark.asyncio
+async def test_history_keyset_pagination():
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        # Batch rows share one created_at, so pages must tie-break on id
+        response = await ac.post("/api/v1/prompts/evaluate/batch", json={
+            "items": [{"prompt_text": f"Page through item {i}", "intended_use": "Reporting"} for i in range(5)]
+        }, headers=headers)
+        assert response.status_code == 200
+
+        everything = (await ac.get("/api/v1/prompts/history", params={"limit": 500}, headers=headers)).json()
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, "fields": "summary", **({"cursor": cursor} if cursor else {})}
+            response = await ac.get("/api/v1/prompts/history", params=params, headers=headers)
+            assert response.status_code == 200
+            page = response.json()
+            assert all("prompt_text" not in item and "prompt_preview" in item for item in page)
+            seen.extend(item["id"] for item in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == [item["id"] for item in everything]
+
+        response = await ac.get("/api/v1/prompts/history", params={"cursor": "not-a-cursor"}, headers=headers)
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_login_upgrades_outdated_password_hash():
+    import uuid
+    from passlib.context import CryptContext
+    from db.session import AsyncSessionLocal
+    from models.user import User
+    from core.security import pwd_context
+
+    old_context = CryptContext(schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=8192, argon2__parallelism=1)
+    email = f"rehash-{uuid.uuid4().hex[:8]}@example.com"
+    async with AsyncSessionLocal() as db:
+        user = User(email=email, hashed_password=old_context.hash("password123"), role="user", is_active=True)
+        db.add(user)
+        await db.commit()
+        assert pwd_context.needs_update(user.hashed_password)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/v1/auth/login", data={"username": email, "password": "password123"})
+        assert response.status_code == 200
+        response = await ac.post("/api/v1/auth/login", data={"username": email, "password": "wrong"})
+        assert response.status_code == 400
+
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.email == email))).scalars().one()
+        assert not pwd_context.needs_update(user.hashed_password)
+        assert pwd_context.verify("password123", user.hashed_password)
+
+@pytest.mark.asyncio
+async def test_repeated_prompts_share_one_blob():
+    import uuid
+    from sqlalchemy import func, select
+    from db.session import AsyncSessionLocal
+    from models.prompt import PromptBlob, PromptRequest
+
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    template = f"Summarise the quarterly report {uuid.uuid4().hex} " + "with full detail " * 20
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        for _ in range(3):
+            response = await ac.post("/api/v1/prompts/evaluate", json={"prompt_text": template, "intended_use": "Reporting"}, headers=headers)
+            assert response.status_code == 200
+            assert response.json()["prompt_text"] == template
+
+        history = (await ac.get("/api/v1/prompts/history", params={"limit": 3}, headers=headers)).json()
+        assert [item["prompt_text"] for item in history] == [template] * 3
+        summary = (await ac.get("/api/v1/prompts/history", params={"limit": 1, "fields": "summary"}, headers=headers)).json()
+        assert summary[0]["prompt_preview"] == template[:120]
+
+    async with AsyncSessionLocal() as db:
+        blob = (await db.execute(select(PromptBlob).where(PromptBlob.preview == template[:120]))).scalar_one()
+        assert blob.codec == "zlib" and len(blob.data) < blob.size
+        assert blob.text == template
+        assert await db.scalar(select(func.count(PromptRequest.id)).where(PromptRequest.prompt_hash == blob.hash)) == 3
+
+@pytest.mark.asyncio
+async def test_admin_search():
+    import uuid
+    from db.session import AsyncSessionLocal
+    from models.user import User
+    from core.security import pwd_context
+    from services.search import search_page
+
+    marker = f"case{uuid.uuid4().hex[:10]}"
+    admin_email = f"admin-{marker}@example.com"
+    async with AsyncSessionLocal() as db:
+        db.add(User(email=admin_email, hashed_password=pwd_context.hash("password123"), role="admin", is_active=True))
+        await db.commit()
+
+    token = await test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/api/v1/auth/login", data={"username": admin_email, "password": "password123"})
+        admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await ac.post("/api/v1/rules/", json={
+            "name": f"Leak {marker}", "type": "KEYWORD", "severity": "BLOCK", "payload_json": {"keywords": ["exfiltrate"]},
+        }, headers=admin)
+        rule_id = response.json()["id"]
+
+        for text in (f"Exfiltrate the {marker} customer list", f"Summarise the customer list for {marker}", "Unrelated prompt"):
+            response = await ac.post("/api/v1/prompts/evaluate", json={"prompt_text": text, "intended_use": "Research"}, headers=headers)
+            assert response.status_code == 200
+
+        async def search(**params):
+            response = await ac.get("/api/v1/admin/search", params=params, headers=admin)
+            assert response.status_code == 200
+            return response
+
+        found = (await search(q=marker)).json()
+        assert [item["prompt_preview"] for item in found] == [f"Summarise the customer list for {marker}", f"Exfiltrate the {marker} customer list"]
+        assert len((await search(q=f'"customer list" {marker}')).json()) == 2
+        assert len((await search(q=f'"list customer" {marker}')).json()) == 0
+        assert [item["decision"] for item in (await search(q=marker, decision="DECLINE")).json()] == ["DECLINE"]
+        assert len((await search(q=marker, rule_id=rule_id)).json()) == 1
+        assert len((await search(q=marker, user_id=found[0]["user_id"] + 100000)).json()) == 0
+        # Matches on the reason summary, which names the triggered rule
+        assert [item["id"] for item in (await search(q=f"Leak {marker}")).json()] == [found[1]["id"]]
+
+        first = await search(q=marker, limit=1)
+        second = await search(q=marker, limit=1, cursor=first.headers["X-Next-Cursor"])
+        assert [first.json()[0]["id"], second.json()[0]["id"]] == [item["id"] for item in found]
+        assert "X-Next-Cursor" not in second.headers
+
+        response = await ac.get("/api/v1/admin/search", params={"q": marker}, headers=headers)
+        assert response.status_code == 403
+
+        for blank in (" ", '""', '" "'):
+            response = await ac.get("/api/v1/admin/search", params={"q": blank}, headers=admin)
+            assert response.status_code == 400
+    async with AsyncSessionLocal() as db:
+        assert await search_page(db, " ") == ([], None)
+        assert await search_page(db, '""') == ([], None)
+
+@pytest.mark.asyncio
+async def test_ready_after_warm_up():
+    from services.warmup import WarmUp
+    import main
+
+    # The lifespan does not run under ASGITransport, so drive a warm-up directly
+    original, warm_up = main.warm_up, WarmUp(retry_seconds=0.01)
+    main.warm_up = warm_up
+    try:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.get("/ready")
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+            assert (await ac.get("/health")).status_code == 200
+
+            warm_up.start()
+            try:
+                await asyncio.wait_for(warm_up.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                await warm_up.stop()
+                pytest.fail(f"Warm-up did not finish: {warm_up.status()['error']}")
+            response = await ac.get("/ready")
+            assert response.status_code == 200
+            body = response.json()
+            assert body["status"] == "ready" and body["import_seconds"] > 0
+            assert set(body["warm_up"]["steps"]) == {"security", "rules", "matchers", "executor"}
+    finally:
+        main.warm_up = original
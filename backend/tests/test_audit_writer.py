@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+import uuid
+import pytest
+from sqlalchemy import select, func
+from db.session import AsyncSessionLocal
+from models.user import User
+from models.prompt import PromptRequest
+from services.audit_writer import AuditWriter
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_in_batches_and_drains_on_stop():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"audit-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+        writer = AuditWriter(mode="write-behind", batch_size=4, flush_interval=0.05)
+        await writer.start()
+        for i in range(10):
+            await writer.submit([PromptRequest(user_id=user.id, prompt_text=f"p{i}", intended_use="test", decision="ACCEPT")])
+        await writer.stop()
+
+        assert writer.flushed == 10
+        assert writer.queued == 0
+        count = await db.scalar(select(func.count(PromptRequest.id)).where(PromptRequest.user_id == user.id))
+        assert count == 10
+
+
+@pytest.mark.asyncio
+async def test_a_bad_row_only_drops_itself():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"audit-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+        writer = AuditWriter(mode="write-behind", batch_size=8, flush_interval=0.05)
+        await writer.start()
+        for i in range(8):
+            # intended_use is NOT NULL
+            intended_use = None if i == 5 else "test"
+            await writer.submit([PromptRequest(user_id=user.id, prompt_text=f"p{i}", intended_use=intended_use, decision="ACCEPT")])
+        await writer.stop()
+
+        assert (writer.flushed, writer.failed) == (7, 1)
+        count = await db.scalar(select(func.count(PromptRequest.id)).where(PromptRequest.user_id == user.id))
+        assert count == 7
@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+import uuid
+import pytest
+from db.session import AsyncSessionLocal
+from models.user import User
+from models.rule import Rule
+from models.prompt import PromptRequest
+from services.backtest import CandidateRule, candidate_set, run_backtest
+from services.rule_engine import build_snapshot, compile_rule
+
+@pytest.mark.asyncio
+async def test_backtest_reports_changed_decisions_and_hits():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"backtest-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        texts = ["share the salary report"] * 3 + ["the launch plan is secret"] * 2 + ["weekly status update"]
+        db.add_all([
+            PromptRequest(user_id=user.id, prompt_text=text, intended_use="test", decision="ACCEPT")
+            for text in texts
+        ])
+        await db.commit()
+
+        active = [compile_rule(Rule(id=1, name="secret", type="KEYWORD", severity="BLOCK", version=1,
+                                    payload_json={"keywords": ["secret"]}))]
+        report = await run_backtest(
+            db, active,
+            [CandidateRule(name="salary", type="KEYWORD", payload={"keywords": ["salary"]})],
+            disable=[1], user_id=user.id, workers=2,
+        )
+
+    assert (report["prompts"], report["requests"]) == (3, 6)
+    assert (report["declined_before"], report["declined_after"]) == (2, 3)
+    assert report["newly_declined"]["requests"] == 3
+    assert [s["prompt_preview"] for s in report["newly_declined"]["samples"]] == ["share the salary report"]
+    assert report["newly_accepted"]["requests"] == 2
+    hits = {rule["name"]: (rule["status"], rule["hits"]) for rule in report["rules"]}
+    assert hits == {"secret": ("removed", 2), "salary": ("added", 3)}
+
+
+def test_candidate_rules_merge_into_the_combined_regex():
+    active = [compile_rule(Rule(id=7, name="ssn", type="REGEX", severity="BLOCK", version=1,
+                                payload_json={"pattern": r"\b\d{3}-\d{2}-\d{4}\b"}))]
+    rules = candidate_set(active, [CandidateRule(name="iban", type="REGEX", payload={"pattern": r"\bDE\d{20}\b"})])
+    assert [rule.id for rule in rules] == [7, 8]
+    regex = build_snapshot(0, (), rules).block_matcher.regex
+    assert regex.combined is not None and regex.standalone == []
@@ -0,0 +1,17 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+from sqlalchemy.ext.asyncio import create_async_engine
+from core.config import settings
+from db.session import InstrumentedPool, engine_options
+
+def test_pool_options_only_apply_to_server_databases():
+    assert engine_options("sqlite+aiosqlite:///./dev.db") == {"echo": settings.DB_ECHO}
+
+    options = engine_options("postgresql+asyncpg://user:pass@db/app")
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["connect_args"] == {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+
+    engine = create_async_engine("postgresql+asyncpg://user:pass@db/app", **options)
+    assert isinstance(engine.pool, InstrumentedPool)
+    assert engine.pool.size() == settings.DB_POOL_SIZE
@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+import csv
+import io
+import json
+import uuid
+from datetime import datetime, timezone
+import pytest
+from db.session import AsyncSessionLocal
+from models.user import User
+from models.prompt import PromptRequest, PromptEvaluation
+from services import export
+from services.export import export_query, stream_csv, stream_ndjson
+
+@pytest.mark.asyncio
+async def test_export_streams_filtered_history_as_ndjson_and_csv():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"export-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        db.add_all([
+            PromptRequest(user_id=user.id, prompt_text="old", intended_use="test", decision="ACCEPT",
+                          created_at=datetime(2026, 1, 1, tzinfo=timezone.utc)),
+            PromptRequest(user_id=user.id, prompt_text="new, \"quoted\"", intended_use="test", decision="DECLINE",
+                          created_at=datetime(2026, 2, 1, tzinfo=timezone.utc),
+                          evaluation=PromptEvaluation(triggered_rules_json=[7], trace_json={"mode": "full-audit"})),
+        ])
+        await db.commit()
+
+    query = export_query(user_id=user.id, since=datetime(2026, 1, 15, tzinfo=timezone.utc))
+    records = [json.loads(line) async for line in stream_ndjson(query)]
+    assert [(r["prompt_text"], r["decision"], r["triggered_rules"]) for r in records] == [("new, \"quoted\"", "DECLINE", [7])]
+    assert records[0]["trace"] == {"mode": "full-audit"}
+
+    text = "".join([chunk async for chunk in stream_csv(export_query(user_id=user.id))])
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert [row["prompt_text"] for row in rows] == ["old", "new, \"quoted\""]
+    assert rows[0]["triggered_rules"] == "" and json.loads(rows[1]["triggered_rules"]) == [7]
+
+
+@pytest.mark.asyncio
+async def test_csv_export_defuses_formulas_and_batches_rows(monkeypatch):
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"export-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        texts = ["=HYPERLINK(\"http://x\")", "+1", "-1", "@SUM(A1)", "plain"]
+        db.add_all([PromptRequest(user_id=user.id, prompt_text=text, intended_use="test") for text in texts])
+        await db.commit()
+
+    monkeypatch.setattr(export, "CSV_FLUSH_ROWS", 2)
+    chunks = [chunk async for chunk in stream_csv(export_query(user_id=user.id))]
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert sorted(row["prompt_text"] for row in rows) == sorted(["'" + text for text in texts[:4]] + ["plain"])
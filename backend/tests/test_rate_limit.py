@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+import asyncio
+from types import SimpleNamespace
+import pytest
+from services.rate_limit import ConcurrencyLimiter, Overloaded, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_token_buckets_per_user_and_role():
+    limiter = RateLimiter(per_minute=60, burst_seconds=3, role_per_minute={"admin": 600},
+                          role_total_per_minute={"user": 120})
+    clock = limiter.local.clock = FakeClock()
+    alice, bob = SimpleNamespace(id=1, role="user"), SimpleNamespace(id=2, role="user")
+    admin = SimpleNamespace(id=3, role="admin")
+
+    assert [await limiter.acquire(alice) for _ in range(3)] == [0, 0, 0]
+    assert await limiter.acquire(alice) == pytest.approx(1.0)
+    # Bob has his own bucket, but the "user" role's shared bucket (capacity 6) runs dry
+    assert [await limiter.acquire(bob) for _ in range(3)] == [0, 0, 0]
+    assert await limiter.acquire(SimpleNamespace(id=4, role="user")) == pytest.approx(0.5)
+    # Admins get a higher per-user rate and no role-wide limit
+    assert await limiter.acquire(admin, cost=30) == 0
+    assert await limiter.acquire(admin) > 0
+
+    clock.now += 1
+    assert await limiter.acquire(alice) == 0
+    # A batch larger than the bucket waits for a full bucket, then is charged in full
+    clock.now += 10
+    assert await limiter.acquire(bob, cost=50) == 0
+    assert await limiter.acquire(bob) == pytest.approx(48.0)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_sheds_load_after_queue_timeout():
+    limiter = ConcurrencyLimiter(limit=2, queue_timeout=0.05)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.slot():
+            await release.wait()
+
+    holders = [asyncio.create_task(hold()) for _ in range(2)]
+    try:
+        await asyncio.sleep(0.01)
+        assert limiter.in_flight == 2
+        with pytest.raises(Overloaded):
+            async with limiter.slot():
+                pass
+    finally:
+        release.set()
+        await asyncio.gather(*holders)
+    async with limiter.slot():
+        assert limiter.in_flight == 1
@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.append(os.getcwd()) # Ensure root is in path
+import uuid
+from datetime import date, datetime, timezone
+import pytest
+from sqlalchemy import event, select
+from db.session import AsyncSessionLocal, engine
+from models.user import User
+from models.prompt import PromptRequest
+from models.stats import UserStats, UserDailyStats
+from services.user_stats import record_decisions, rebuild
+from services.partitions import add_months, partition_month, partition_name, retention_cutoff
+
+async def _counters(db, user_id):
+    totals = (await db.execute(
+        select(UserStats.total, UserStats.accepted_count, UserStats.declined_count).where(UserStats.user_id == user_id)
+    )).one()
+    days = (await db.execute(
+        select(UserDailyStats.day, UserDailyStats.total, UserDailyStats.accepted_count, UserDailyStats.declined_count)
+        .where(UserDailyStats.user_id == user_id).order_by(UserDailyStats.day)
+    )).all()
+    return tuple(totals), [tuple(day) for day in days]
+
+@pytest.mark.asyncio
+async def test_counters_are_incremented_on_write_and_match_a_rebuild():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"stats-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+        jan_1 = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+        jan_2 = datetime(2026, 1, 2, 12, tzinfo=timezone.utc)
+        for batch in (
+            [PromptRequest(user_id=user.id, prompt_text="a", intended_use="test", decision="ACCEPT", created_at=jan_1),
+             PromptRequest(user_id=user.id, prompt_text="b", intended_use="test", decision="DECLINE", created_at=jan_1)],
+            [PromptRequest(user_id=user.id, prompt_text="c", intended_use="test", decision="ACCEPT", created_at=jan_2)],
+        ):
+            db.add_all(batch)
+            await record_decisions(db, batch)
+            await db.commit()
+
+        incremental = await _counters(db, user.id)
+        assert incremental[0] == (3, 2, 1)
+        assert [day[1:] for day in incremental[1]] == [(2, 1, 1), (1, 1, 0)]
+
+        await rebuild(db)
+        assert await _counters(db, user.id) == incremental
+
+@pytest.mark.asyncio
+async def test_audit_rows_are_inserted_before_counters_are_upserted_in_user_order():
+    async with AsyncSessionLocal() as db:
+        users = [User(email=f"stats-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x") for _ in range(2)]
+        db.add_all(users)
+        await db.commit()
+        low, high = sorted(user.id for user in users)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement.split()[2].strip('"').lower(), parameters))
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            batch = [PromptRequest(user_id=user_id, prompt_text="x", intended_use="test", decision="ACCEPT")
+                     for user_id in (high, low, high)]
+            db.add_all(batch)
+            await record_decisions(db, batch)
+            await db.rollback()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    tables = [table for table, _ in statements if table in ("promptrequest", "userstats")]
+    assert tables.index("promptrequest") < tables.index("userstats")
+    upserted = [parameters[0] for table, parameters in statements if table == "userstats"]
+    assert upserted == [low, high]
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_days_rolled_up_before_retention():
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"stats-{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+        # What apply-retention leaves behind: a rolled-up day with no raw rows
+        # left, as the oldest day of all history.
+        archived = date(1999, 1, 1)
+        db.add(UserDailyStats(user_id=user.id, day=archived, total=4, accepted_count=3, declined_count=1))
+        await db.commit()
+
+        await rebuild(db)
+        totals, days = await _counters(db, user.id)
+        assert totals == (4, 3, 1)
+        assert days == [(archived, 4, 3, 1)]
+
+def test_retention_cutoff_and_partition_names():
+    assert retention_cutoff(12, today=date(2026, 10, 16)) == date(2025, 11, 1)
+    assert retention_cutoff(1, today=date(2026, 1, 31)) == date(2026, 1, 1)
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert partition_month(partition_name(date(2026, 3, 1))) == date(2026, 3, 1)
+    assert partition_month("promptrequest_default") is None